@@ -2,6 +2,7 @@
 Base settings to build other settings files upon.
 """
 
+import tempfile
 from pathlib import Path
 
 import environ
@@ -55,6 +56,14 @@
     }
 }
 
+# https://channels.readthedocs.io/en/stable/topics/channel_layers.html
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "CONFIG": {"hosts": [env("REDIS_URL")]},
+    }
+}
+
 # DATABASES
 # ------------------------------------------------------------------------------
 # https://docs.djangoproject.com/en/dev/ref/settings/#databases
@@ -69,6 +78,8 @@
 ROOT_URLCONF = "config.urls"
 # https://docs.djangoproject.com/en/dev/ref/settings/#wsgi-application
 WSGI_APPLICATION = "config.wsgi.application"
+# https://channels.readthedocs.io/en/stable/deploying.html#configuring-the-asgi-application
+ASGI_APPLICATION = "config.asgi.application"
 
 # APPS
 # ------------------------------------------------------------------------------
@@ -89,6 +100,7 @@
     "rest_framework.authtoken",
     "corsheaders",
     "drf_spectacular",
+    "channels",
 ]
 
 LOCAL_APPS = [
@@ -270,8 +282,7 @@
             "handlers": ["console", "flat_line_file", "json_file"],
             "level": "INFO",
         },
-        # Make sure to replace the following logger's name for yours
-        "django_structlog_demo_project": {
+        "invest_advisor": {
             "handlers": ["console", "flat_line_file", "json_file"],
             "level": "INFO",
         },
@@ -327,6 +338,11 @@
 CELERY_WORKER_SEND_TASK_EVENTS = True
 # https://docs.celeryq.dev/en/stable/userguide/configuration.html#std-setting-task_send_sent_event
 CELERY_TASK_SEND_SENT_EVENT = True
+# https://docs.celeryq.dev/en/stable/userguide/configuration.html#task-routes
+# PDF rendering has its own queue and worker pool, see compose/*/django/celery/reports
+CELERY_TASK_ROUTES = {
+    "invest_advisor.chat.tasks.render_report": {"queue": "reports"},
+}
 # DRF
 # -------------------------------------------------------------------------------
 # django-rest-framework - https://www.django-rest-framework.org/api-guide/settings/
@@ -362,3 +378,46 @@
 DADATA_API_KEY = env("DADATA_API_KEY", default="")
 DADATA_SECRET_KEY = env("DADATA_SECRET_KEY", default="")
 ML_HOST = env("ML_HOST", default="http://81.19.140.77:8000")
+# Tasks of one chat are serialized, this caps concurrent ML calls across all chats
+ML_MAX_CONCURRENCY = env.int("ML_MAX_CONCURRENCY", default=4)
+# Must outlive the slowest ML task, otherwise the chat lock expires mid-call
+ML_LOCK_TIMEOUT = env.int("ML_LOCK_TIMEOUT", default=180)
+ML_RETRY_COUNTDOWN = env.int("ML_RETRY_COUNTDOWN", default=2)
+# Pooled keep-alive connections to ML_HOST, one pool per worker process
+ML_POOL_SIZE = env.int("ML_POOL_SIZE", default=10)
+ML_CONNECT_TIMEOUT = env.float("ML_CONNECT_TIMEOUT", default=5)
+ML_READ_TIMEOUT = env.float("ML_READ_TIMEOUT", default=60)
+# Larger ML replies are rejected before they are decoded
+ML_MAX_REPLY_SIZE = env.int("ML_MAX_REPLY_SIZE", default=2 * 1024 * 1024)
+# Bulk submissions: ML host has /conversation/batch, submissions per batch task
+ML_BATCH_CONVERSATION = env.bool("ML_BATCH_CONVERSATION", default=False)
+ML_BATCH_SIZE = env.int("ML_BATCH_SIZE", default=20)
+ML_BULK_MAX_SUBMISSIONS = env.int("ML_BULK_MAX_SUBMISSIONS", default=1000)
+# Best ranked places sent to the ML service, 0 sends every filtered place name
+ML_RANKED_PLACES = env.int("ML_RANKED_PLACES", default=50)
+# Filtered places closest to the free-text preferences that stay candidates, 0 disables
+ML_SEMANTIC_CANDIDATES = env.int("ML_SEMANTIC_CANDIDATES", default=200)
+# Longest ?wait= of the chat messages long poll, in seconds
+CHAT_LONG_POLL_TIMEOUT = env.int("CHAT_LONG_POLL_TIMEOUT", default=25)
+# Memory-mapped catalog snapshots shared by the processes of a host, one per
+# catalog version; empty keeps a private snapshot in every process
+CATALOG_SNAPSHOT_DIR = env(
+    "CATALOG_SNAPSHOT_DIR",
+    default=str(Path(tempfile.gettempdir()) / "invest_advisor_catalog"),
+)
+# Serialized catalog tables shown in chat messages, one per catalog version
+CATALOG_PROJECTION_CACHE_TIMEOUT = env.int(
+    "CATALOG_PROJECTION_CACHE_TIMEOUT", default=60 * 60 * 24
+)
+# Latent semantic index of the catalog descriptions: SVD dimensions and the
+# most frequent stemmed words kept
+EMBEDDING_DIMENSIONS = env.int("EMBEDDING_DIMENSIONS", default=128)
+EMBEDDING_MAX_TERMS = env.int("EMBEDDING_MAX_TERMS", default=5000)
+# "wkhtmltopdf" or "xhtml2pdf" (pure python, needs the "reports" extra)
+REPORT_RENDERER = env("REPORT_RENDERER", default="wkhtmltopdf")
+# TTF font with cyrillic glyphs for the xhtml2pdf renderer
+REPORT_FONT_PATH = env(
+    "REPORT_FONT_PATH", default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+)
+# ML advice/support replies are reused for the same company and place
+REPORT_CACHE_TIMEOUT = env.int("REPORT_CACHE_TIMEOUT", default=60 * 60 * 24 * 7)
@@ -1,6 +1,8 @@
+from django.conf import settings
 from django.db.models import QuerySet
 from rest_framework import serializers
 
+from invest_advisor.chat.catalog import CatalogProjection, get_catalog_projection
 from invest_advisor.chat.models import (
     BuildingModel,
     BuildingSubmission,
@@ -77,8 +79,9 @@ class Meta:
 class ListChatMessagesSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChatMessage
-        fields = ["text", "from_user", "created", "file", "data"]
+        fields = ["id", "text", "from_user", "created", "file", "data"]
         extra_kwargs = {
+            "id": {"read_only": True},
             "from_user": {"read_only": True},
             "created": {"read_only": True},
         }
@@ -86,6 +89,13 @@ class Meta:
     def save(self, **kwargs):
         return ChatMessage.objects.create(**kwargs, **self.validated_data)
 
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        if instance.place_ids is not None:
+            projection = get_place_projection(instance.place_type)
+            representation["data"] = projection.table(instance.place_ids)
+        return representation
+
 
 class TechnoparkTableDataSerializer(serializers.ModelSerializer):
     class Meta:
@@ -117,5 +127,60 @@ class Meta:
         ]
 
 
+PLACE_TABLES = {
+    "technopark": (Technopark, TechnoparkTableDataSerializer),
+    "building": (BuildingModel, BuildingTableDataSerializer),
+}
+
+
+def get_place_projection(place_type: str) -> CatalogProjection:
+    return get_catalog_projection(*PLACE_TABLES[place_type])
+
+
 class RequestFileSerializer(serializers.Serializer):
     name = serializers.CharField()
+
+
+class BulkSubmitSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=["technopark", "building"])
+    ids = serializers.ListField(
+        child=serializers.UUIDField(),
+        min_length=1,
+        max_length=settings.ML_BULK_MAX_SUBMISSIONS,
+    )
+
+    def validate(self, attrs):
+        model = (
+            TechnoparkSubmission
+            if attrs["type"] == "technopark"
+            else BuildingSubmission
+        )
+        ids = list(dict.fromkeys(attrs["ids"]))
+        found = set(model.objects.filter(id__in=ids).values_list("id", flat=True))
+        missing = [str(pk) for pk in ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                {"ids": [f"Unknown submissions: {', '.join(missing)}"]}
+            )
+        return {"type": attrs["type"], "ids": ids}
+
+
+class BulkProgressSerializer(serializers.Serializer):
+    job_id = serializers.CharField()
+    type = serializers.CharField()
+    total = serializers.IntegerField()
+    batches = serializers.IntegerField()
+    batches_done = serializers.IntegerField()
+    done = serializers.IntegerField()
+    failed = serializers.IntegerField()
+
+
+class NearbyQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    radius_km = serializers.FloatField(min_value=0, required=False)
+
+
+class RankingQuerySerializer(serializers.Serializer):
+    k = serializers.IntegerField(min_value=1, max_value=100, default=10)
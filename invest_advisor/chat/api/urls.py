@@ -1,11 +1,17 @@
 from django.urls import path
 
 from invest_advisor.chat.api.views import (
+    BuildingFacetsAPIView,
     BuildingOptionsAPIView,
+    BulkProgressAPIView,
+    BulkSubmitAPIView,
     ListChatAPIView,
     ListCreateBuildingSubmissionAPIView,
     ListCreateChatMessageAPIView,
     ListCreateTechnoparkSubmissionAPIView,
+    MLStatsAPIView,
+    NearbyPlacesAPIView,
+    PlaceRankingAPIView,
     RequestFileAPIView,
     RetrieveUpdateDestroyBuildingSubmissionAPIView,
     RetrieveUpdateDestroyTechnoparkSubmissionAPIView,
@@ -18,6 +24,9 @@
 
 urlpatterns = [
     path("", ListChatAPIView.as_view(), name="chat"),
+    path("ml/stats/", MLStatsAPIView.as_view(), name="ml-stats"),
+    path("bulk/submit/", BulkSubmitAPIView.as_view(), name="bulk-submit"),
+    path("bulk/<str:job_id>/", BulkProgressAPIView.as_view(), name="bulk-progress"),
     path(
         "<str:id>/messages/",
         ListCreateChatMessageAPIView.as_view(),
@@ -33,6 +42,12 @@
         ListCreateTechnoparkSubmissionAPIView.as_view(),
         name="technopark",
     ),
+    path(
+        "technopark/nearby/",
+        NearbyPlacesAPIView.as_view(),
+        {"place_type": "technopark"},
+        name="technopark-nearby",
+    ),
     path(
         "technopark/<str:id>",
         RetrieveUpdateDestroyTechnoparkSubmissionAPIView.as_view(),
@@ -43,6 +58,12 @@
         SubmitTechnoparkSubmissionAPIView.as_view(),
         name="technopark-detail",
     ),
+    path(
+        "technopark/<str:id>/ranking/",
+        PlaceRankingAPIView.as_view(),
+        {"place_type": "technopark"},
+        name="technopark-ranking",
+    ),
     path(
         "technopark/<str:id>/question/<int:question>/options/",
         TechnoparkOptionsAPIView.as_view(),
@@ -53,6 +74,12 @@
         ListCreateBuildingSubmissionAPIView.as_view(),
         name="building",
     ),
+    path(
+        "building/nearby/",
+        NearbyPlacesAPIView.as_view(),
+        {"place_type": "building"},
+        name="building-nearby",
+    ),
     path(
         "building/<str:id>",
         RetrieveUpdateDestroyBuildingSubmissionAPIView.as_view(),
@@ -63,6 +90,17 @@
         BuildingOptionsAPIView.as_view(),
         name="building-options",
     ),
+    path(
+        "building/<str:id>/ranking/",
+        PlaceRankingAPIView.as_view(),
+        {"place_type": "building"},
+        name="building-ranking",
+    ),
+    path(
+        "building/<str:id>/options/",
+        BuildingFacetsAPIView.as_view(),
+        name="building-facets",
+    ),
     path(
         "building/<str:id>/submit/",
         SubmitBuildingSubmissionAPIView.as_view(),
@@ -1,31 +1,56 @@
-from drf_spectacular.utils import extend_schema
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.decorators import method_decorator
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
+from invest_advisor.chat import ml
 from invest_advisor.chat.api.serializers import (
     BuildingSubmissionSerializer,
+    BulkProgressSerializer,
+    BulkSubmitSerializer,
     ListBuildingSubmissionSerializer,
     ListChatMessagesSerializer,
     ListChatsSerializer,
     ListTechnoparkSubmissionSerializer,
+    NearbyQuerySerializer,
     OptionsSerializer,
+    RankingQuerySerializer,
     RequestFileSerializer,
     TechnoparkSubmissionSerializer,
+    get_place_projection,
 )
+from invest_advisor.chat.catalog import get_catalog_version
+from invest_advisor.chat.facets import get_building_facets, get_technopark_facets
 from invest_advisor.chat.models import (
     BuildingSubmission,
     Chat,
     ChatMessage,
     TechnoparkSubmission,
 )
+from invest_advisor.chat.scoring import rank_places
 from invest_advisor.chat.services import (
-    filter_buildings,
-    filter_technoparks,
-    get_options_for_building_question,
-    get_options_for_technopark_question,
+    PLACE_FILTERS,
+    chat_messages_version,
+    get_building_question_fields,
+    get_options_from_building_facets,
+    get_options_from_technopark_facets,
+    nearest_places,
+    wait_for_chat_messages,
+)
+from invest_advisor.chat.tasks import (
+    SUBMISSIONS,
+    get_bulk_progress,
+    send_data_to_ml,
+    start_bulk_submit,
 )
-from invest_advisor.chat.tasks import send_data_to_ml
+from invest_advisor.common.api import CreatedCursorPagination
 
 
 class ListCreateTechnoparkSubmissionAPIView(generics.ListCreateAPIView):
@@ -79,8 +104,8 @@ def get(self, request, *args, **kwargs):
                 {"error": "Question ID must be an integer"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        options, next_id = get_options_for_technopark_question(
-            question_id, filter_technoparks(submission)
+        options, next_id = get_options_from_technopark_facets(
+            question_id, get_technopark_facets(submission)
         )
         serializer = self.get_serializer(options)
         return Response(
@@ -101,8 +126,8 @@ def get(self, request, *args, **kwargs):
                 {"error": "Question ID must be an integer"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        options, next_question = get_options_for_building_question(
-            question_id, filter_buildings(submission), submission
+        options, next_question = get_options_from_building_facets(
+            question_id, get_building_facets(submission), submission
         )
         serializer = self.get_serializer(options)
         return Response(
@@ -111,6 +136,30 @@ def get(self, request, *args, **kwargs):
         )
 
 
+class BuildingFacetsAPIView(generics.GenericAPIView):
+    """Options of every question at once, lets the client prefetch the next step."""
+
+    serializer_class = OptionsSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        submission = get_object_or_404(BuildingSubmission, id=self.kwargs["id"])
+        facets = get_building_facets(submission)
+        questions = {}
+        for question_id in get_building_question_fields(submission):
+            options, next_question = get_options_from_building_facets(
+                question_id, facets, submission
+            )
+            questions[question_id] = {
+                **self.get_serializer(options).data,
+                "next_question": next_question,
+            }
+        return Response(
+            {"count": facets["count"], "questions": questions},
+            status=status.HTTP_200_OK,
+        )
+
+
 class ListCreateBuildingSubmissionAPIView(generics.ListCreateAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = BuildingSubmissionSerializer
@@ -189,6 +238,89 @@ def post(self, request, *args, **kwargs):
         )
 
 
+class BulkSubmitAPIView(generics.GenericAPIView):
+    """Submit many technopark or building submissions, sent to ML in batches."""
+
+    permission_classes = [permissions.AllowAny]
+    serializer_class = BulkSubmitSerializer
+
+    @extend_schema(
+        request=BulkSubmitSerializer, responses={202: BulkProgressSerializer}
+    )
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        progress = start_bulk_submit(
+            serializer.validated_data["type"], serializer.validated_data["ids"]
+        )
+        return Response(
+            BulkProgressSerializer(progress).data, status=status.HTTP_202_ACCEPTED
+        )
+
+
+class BulkProgressAPIView(generics.GenericAPIView):
+    permission_classes = [permissions.AllowAny]
+    serializer_class = BulkProgressSerializer
+
+    def get(self, request, *args, **kwargs):
+        progress = get_bulk_progress(self.kwargs["job_id"])
+        if progress is None:
+            return Response(
+                {"error": "Unknown bulk submission"}, status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(self.get_serializer(progress).data, status=status.HTTP_200_OK)
+
+
+class NearbyPlacesAPIView(generics.GenericAPIView):
+    """Nearest technoparks or buildings to a point, with their distance in km."""
+
+    permission_classes = [permissions.AllowAny]
+    serializer_class = NearbyQuerySerializer
+
+    @extend_schema(parameters=[NearbyQuerySerializer], responses={200: {}})
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        place_type = self.kwargs["place_type"]
+        places = nearest_places(place_type, **serializer.validated_data)
+        projection = get_place_projection(place_type)
+        rows = [
+            {**projection.rows[pk], "distance_km": round(distance, 3)}
+            for pk, distance in places
+            if pk in projection.rows
+        ]
+        return Response(rows, status=status.HTTP_200_OK)
+
+
+class PlaceRankingAPIView(generics.GenericAPIView):
+    """
+    Best matching technoparks or buildings of a submission, with the score of
+    every place and how well it meets each answered criterion.
+    """
+
+    permission_classes = [permissions.AllowAny]
+    serializer_class = RankingQuerySerializer
+
+    @extend_schema(parameters=[RankingQuerySerializer], responses={200: {}})
+    def get(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        place_type = self.kwargs["place_type"]
+        submission = get_object_or_404(SUBMISSIONS[place_type][0], id=self.kwargs["id"])
+        ranking = rank_places(place_type, submission, serializer.validated_data["k"])
+        projection = get_place_projection(place_type)
+        rows = [
+            {
+                **projection.rows[place["pk"]],
+                "score": place["score"],
+                "criteria": place["criteria"],
+            }
+            for place in ranking
+            if place["pk"] in projection.rows
+        ]
+        return Response(rows, status=status.HTTP_200_OK)
+
+
 class ListChatAPIView(generics.ListAPIView):
     permission_classes = [permissions.AllowAny]
     serializer_class = ListChatsSerializer
@@ -199,13 +331,32 @@ def get_queryset(self):
         return Chat.objects.none()
 
 
+# a long poll must not hold a transaction open while it waits
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
 class ListCreateChatMessageAPIView(generics.ListCreateAPIView):
+    """
+    Messages of a chat, oldest first and paginated by cursor. ``after=<message id>``
+    returns only the messages posted after that one.
+    """
+
     serializer_class = ListChatMessagesSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = CreatedCursorPagination
 
     def get_queryset(self):
         chat = get_object_or_404(Chat, id=self.kwargs["id"])
-        return ChatMessage.objects.filter(chat=chat).order_by("created")
+        messages = ChatMessage.objects.filter(chat=chat)
+        after = self.request.query_params.get("after")
+        if after:
+            try:
+                last = messages.values("created", "id").get(id=int(after))
+            except (ValueError, ChatMessage.DoesNotExist):
+                raise ValidationError({"after": "Unknown message"})
+            messages = messages.filter(
+                Q(created__gt=last["created"])
+                | Q(created=last["created"], id__gt=last["id"])
+            )
+        return messages
 
     def perform_create(self, serializer):
         chat = get_object_or_404(Chat, id=self.kwargs["id"])
@@ -214,9 +365,59 @@ def perform_create(self, serializer):
             kwargs={"type": "message", "obj_id": message.id}, countdown=1
         )
 
-    @extend_schema(request=None, responses={200: ListChatMessagesSerializer(many=True)})
+    def get_etag(self, version) -> str:
+        # the same chat state still gives different pages for other parameters
+        query = self.request.query_params.copy()
+        query.pop("wait", None)
+        # place tables of the messages are rendered from the current catalog
+        catalog = [get_catalog_version(model) for model, _ in PLACE_FILTERS.values()]
+        key = f"{query.urlencode()}:{catalog}"
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        return f'"{version}-{digest}"'
+
+    def not_modified(self, version) -> bool:
+        etags = self.request.headers.get("If-None-Match", "").split(",")
+        return version is not None and self.get_etag(version) in map(str.strip, etags)
+
+    @extend_schema(
+        request=None,
+        parameters=[
+            OpenApiParameter("after", int),
+            OpenApiParameter(
+                "wait",
+                int,
+                description="With If-None-Match, hold the request up to this many "
+                "seconds until a message is posted",
+            ),
+        ],
+        responses={200: ListChatMessagesSerializer(many=True), 304: None},
+    )
     def get(self, request, *args, **kwargs):
-        return super().get(request, *args, **kwargs)
+        """
+        Answers 304 from the chat messages version in Redis while nothing
+        changed, without querying the database.
+        """
+        try:
+            wait = min(
+                int(request.query_params.get("wait", 0)),
+                settings.CHAT_LONG_POLL_TIMEOUT,
+            )
+        except ValueError:
+            raise ValidationError({"wait": "Must be a number of seconds"})
+        chat_id = self.kwargs["id"]
+        version = chat_messages_version(chat_id)
+        if self.not_modified(version) and wait > 0:
+            version = wait_for_chat_messages(chat_id, version, wait)
+        if self.not_modified(version):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={"ETag": self.get_etag(version)},
+            )
+        # read before the messages, a message posted meanwhile changes it again
+        version = chat_messages_version(chat_id, create=True)
+        response = super().get(request, *args, **kwargs)
+        response["ETag"] = self.get_etag(version)
+        return response
 
     @extend_schema(
         request=ListChatMessagesSerializer,
@@ -248,3 +449,11 @@ def post(self, request, *args, **kwargs):
             {"message": "File has been successfully requested for download"},
             status=status.HTTP_200_OK,
         )
+
+
+class MLStatsAPIView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    @extend_schema(request=None, responses={200: {}})
+    def get(self, request, *args, **kwargs):
+        return Response(ml.get_latency_stats(), status=status.HTTP_200_OK)
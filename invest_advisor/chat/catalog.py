@@ -0,0 +1,128 @@
+import re
+import time
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.core.cache import cache
+
+
+def _version_key(model) -> str:
+    return f"catalog_version:{model._meta.model_name}"
+
+
+def get_catalog_version(model) -> int:
+    """
+    Generation counter of a catalog model, shared by all processes. A fresh
+    counter starts from the current time so it never repeats an old value
+    after the cache is flushed.
+    """
+    return cache.get_or_set(_version_key(model), time.time_ns, None)
+
+
+def bump_catalog_version(model) -> int:
+    try:
+        return cache.incr(_version_key(model))
+    except ValueError:
+        return get_catalog_version(model)
+
+
+# Long text fields of the catalog covered by the full-text search, names
+# weigh more than descriptions
+SEARCH_FIELDS = {
+    "technopark": ["restrictions", "additional_infra", "another_benefits"],
+    "buildingmodel": [
+        "building_characteristics",
+        "permitted_use_options",
+        "building_technical_characteristics",
+        "possible_activities",
+        "other_characteristics",
+        "benefit_description",
+        "note",
+        "water_supply_other_characteristics",
+        "sewage_other_characteristics",
+        "gas_supply_other_characteristics",
+        "electricity_other_characteristics",
+        "heating_other_characteristics",
+        "urban_planning_characteristics",
+        "other_information",
+    ],
+}
+
+
+def search_vector(model) -> SearchVector:
+    return SearchVector("name", weight="A", config="russian") + SearchVector(
+        *SEARCH_FIELDS[model._meta.model_name], weight="B", config="russian"
+    )
+
+
+def update_search_vectors(model, pks=None) -> int:
+    """Recompute search_vector of the given objects, or of the whole table."""
+    objects = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    return objects.update(search_vector=search_vector(model))
+
+
+QUOTES = re.compile(r"[\"'«»„“”‘’`]")
+DASHES = re.compile(r"[‐‑‒–—―]")
+
+
+def name_key(name) -> str:
+    """
+    Lookup key of a place name that ignores case, quote style, dash style and
+    whitespace, the ML service does not always repeat names verbatim.
+    """
+    name = QUOTES.sub("", str(name or "")).replace("ё", "е").replace("Ё", "Е")
+    return " ".join(DASHES.sub("-", name).casefold().split())
+
+
+class CatalogProjection:
+    """Table rows of a whole catalog serialized once, by primary key and by name."""
+
+    def __init__(self, version: int, rows: dict):
+        self.version = version
+        self.rows = rows
+        self.pks_by_name = {}
+        for pk, row in rows.items():
+            self.pks_by_name.setdefault(name_key(row["name"]), []).append(pk)
+
+    def resolve(self, names) -> tuple[list, list]:
+        """
+        Primary keys of the places with these names in the order of the names,
+        and the names that match no place.
+        """
+        pks, unmatched = {}, []
+        for name in names:
+            matched = self.pks_by_name.get(name_key(name))
+            if matched:
+                pks.update(dict.fromkeys(matched))
+            else:
+                unmatched.append(name)
+        return list(pks), unmatched
+
+    def table(self, pks) -> list[dict]:
+        """Rows of the places, deleted ones are left out."""
+        return [self.rows[pk] for pk in pks if pk in self.rows]
+
+
+_projections = {}
+
+
+def get_catalog_projection(model, serializer_class) -> CatalogProjection:
+    """
+    Per-process projection of the current catalog version, with the cache as
+    a second level shared by all processes, so the catalog is serialized once
+    per version.
+    """
+    version = get_catalog_version(model)
+    model_name = model._meta.model_name
+    projection = _projections.get(model_name)
+    if projection is None or projection.version != version:
+        rows = cache.get_or_set(
+            f"catalog_projection:{model_name}:{version}",
+            lambda: {
+                row.pk: dict(serializer_class(row).data)
+                for row in model.objects.order_by("pk")
+            },
+            settings.CATALOG_PROJECTION_CACHE_TIMEOUT,
+        )
+        projection = _projections[model_name] = CatalogProjection(version, rows)
+    return projection
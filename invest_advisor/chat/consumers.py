@@ -0,0 +1,60 @@
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.core.exceptions import ValidationError
+
+from invest_advisor.chat.models import Chat, ChatMessage
+from invest_advisor.chat.services import chat_group_name
+from invest_advisor.chat.tasks import send_data_to_ml
+from invest_advisor.utils.channels import BaseConsumer
+
+
+class ChatConsumer(BaseConsumer):
+    """
+    Streams assistant replies of a chat: "chunk" events while the ML service
+    is generating, then a "message" event once the ChatMessage is saved.
+    """
+
+    async def connect(self):
+        self.chat_id = self.scope["url_route"]["kwargs"]["id"]
+        if not await self.chat_exists():
+            await self.close()
+            return
+        self.group_name = chat_group_name(self.chat_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        if content.get("type") != "message" or not content.get("text"):
+            await self.send_error("Expected {'type': 'message', 'text': ...}")
+            return
+        message = await self.create_message(content["text"])
+        await self.enqueue_message(message.id)
+
+    async def chat_chunk(self, event):
+        await self.send_json({"type": "chunk", "data": {"text": event["text"]}})
+
+    async def chat_message(self, event):
+        await self.send_json({"type": "message", "data": event["message"]})
+
+    @database_sync_to_async
+    def chat_exists(self):
+        try:
+            return Chat.objects.filter(id=self.chat_id).exists()
+        except ValidationError:
+            return False
+
+    @database_sync_to_async
+    def create_message(self, text):
+        return ChatMessage.objects.create(
+            chat_id=self.chat_id, from_user=True, text=text
+        )
+
+    @sync_to_async
+    def enqueue_message(self, message_id):
+        send_data_to_ml.apply_async(
+            kwargs={"type": "message", "obj_id": message_id}, countdown=1
+        )
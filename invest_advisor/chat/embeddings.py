@@ -0,0 +1,220 @@
+"""
+Semantic prefilter of the catalog for the free-text preferences of a submission.
+
+Every site is described by its name, the full-text search fields and the items
+of its array filters. The descriptions are embedded once per catalog version
+with latent semantic analysis: TF-IDF of prefix-stemmed words reduced by a
+truncated SVD, stored next to the catalog snapshot. A preference text is
+projected into the same space and compared with every site by cosine
+similarity, so sites described with related words rank close even when they
+share no exact word with the text.
+"""
+import re
+
+import numpy as np
+from django.conf import settings
+
+from invest_advisor.chat.catalog import SEARCH_FIELDS, get_catalog_version
+from invest_advisor.chat.services import PLACE_FILTERS
+from invest_advisor.chat.snapshot import spec_columns, versioned_arrays
+
+WORDS = re.compile(r"[^\W\d_]{3,}")
+# Russian words mostly differ in their endings, the first letters stand in
+# for the stem
+STEM_LENGTH = 6
+
+
+def terms(text: str) -> list[str]:
+    text = text.casefold().replace("ё", "е")
+    return [word[:STEM_LENGTH] for word in WORDS.findall(text)]
+
+
+def description_fields(place_type: str) -> tuple[list, list]:
+    """Text and array fields that describe a site."""
+    model, spec = PLACE_FILTERS[place_type]
+    _, _, array_fields = spec_columns(spec)
+    return ["name", *SEARCH_FIELDS[model._meta.model_name]], array_fields
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+class SparseMatrix:
+    """
+    Matrix of (row, column, value) triplets, the nonzero TF-IDF weights of the
+    descriptions. Only multiplied by dense blocks, never materialized, so the
+    memory stays proportional to the words of the catalog.
+    """
+
+    def __init__(self, rows, columns, values, shape):
+        self.rows = rows
+        self.columns = columns
+        self.values = values
+        self.shape = shape
+
+    def dot(self, dense: np.ndarray) -> np.ndarray:
+        """self @ dense"""
+        return self._product(self.rows, self.columns, dense, self.shape[0])
+
+    def tdot(self, dense: np.ndarray) -> np.ndarray:
+        """self.T @ dense"""
+        return self._product(self.columns, self.rows, dense, self.shape[1])
+
+    def _product(self, rows, columns, dense, size) -> np.ndarray:
+        # one column at a time keeps the temporaries at one value per triplet
+        out = np.empty((size, dense.shape[1]), dtype=np.float64)
+        for j in range(dense.shape[1]):
+            weights = self.values * dense[columns, j]
+            out[:, j] = np.bincount(rows, weights=weights, minlength=size)
+        return out
+
+    def toarray(self) -> np.ndarray:
+        dense = np.zeros(self.shape, dtype=np.float64)
+        dense[self.rows, self.columns] = self.values
+        return dense
+
+
+def truncated_svd(matrix: SparseMatrix, k: int, oversamples=10, iterations=4):
+    """
+    The k largest singular triplets. Small matrices are decomposed exactly,
+    larger ones with a seeded randomized range finder (Halko et al.), which
+    only multiplies by the matrix.
+    """
+    rows, columns = matrix.shape
+    if k == 0:
+        return np.zeros((rows, 0)), np.zeros(0), np.zeros((0, columns))
+    if min(rows, columns) <= k + oversamples:
+        u, s, vt = np.linalg.svd(matrix.toarray(), full_matrices=False)
+        return u[:, :k], s[:k], vt[:k]
+    rng = np.random.default_rng(0)
+    q = matrix.dot(rng.standard_normal((columns, k + oversamples)))
+    for _ in range(iterations):
+        q, _ = np.linalg.qr(q)
+        q = matrix.dot(matrix.tdot(q))
+    q, _ = np.linalg.qr(q)
+    u, s, vt = np.linalg.svd(matrix.tdot(q).T, full_matrices=False)
+    return (q @ u)[:, :k], s[:k], vt[:k]
+
+
+def embedding_columns(place_type: str) -> tuple[dict, dict]:
+    """Meta and arrays of an EmbeddingIndex, from one query."""
+    model, _ = PLACE_FILTERS[place_type]
+    text_fields, array_fields = description_fields(place_type)
+    rows = model.objects.order_by("pk").values_list("pk", *text_fields, *array_fields)
+    pks, documents = [], []
+    n = len(text_fields)
+    for pk, *values in rows:
+        texts = values[:n]
+        for items in values[n:]:
+            texts += items or []
+        pks.append(pk)
+        documents.append(terms(" ".join(text for text in texts if text)))
+
+    document_frequency = {}
+    for document in documents:
+        for term in set(document):
+            document_frequency[term] = document_frequency.get(term, 0) + 1
+    vocabulary = sorted(document_frequency, key=lambda t: (-document_frequency[t], t))
+    vocabulary = vocabulary[: settings.EMBEDDING_MAX_TERMS]
+    index = {term: i for i, term in enumerate(vocabulary)}
+
+    size, width = len(documents), len(vocabulary)
+    df = np.array([document_frequency[term] for term in vocabulary], dtype=np.float64)
+    idf = np.log((1 + size) / (1 + df)) + 1
+    # term counts of every (row, term) pair that occurs
+    lengths = [sum(term in index for term in document) for document in documents]
+    cells = np.repeat(np.arange(size, dtype=np.int64), lengths) * width
+    cells += np.fromiter(
+        (index[term] for document in documents for term in document if term in index),
+        dtype=np.int64,
+        count=sum(lengths),
+    )
+    cells, counts = np.unique(cells, return_counts=True)
+    row, column = np.divmod(cells, max(width, 1))
+    # sublinear term frequency
+    weights = np.log1p(counts) * idf[column]
+    norms = np.sqrt(np.bincount(row, weights=weights**2, minlength=size))
+    weights /= norms[row]
+    tfidf = SparseMatrix(row, column, weights, (size, width))
+
+    k = min(settings.EMBEDDING_DIMENSIONS, size, width)
+    u, s, vt = truncated_svd(tfidf, k)
+    arrays = {
+        "pk": np.array(pks, dtype=np.int64),
+        "idf": idf.astype(np.float32),
+        "components": np.ascontiguousarray(vt, dtype=np.float32),
+        "embeddings": normalize_rows(u * s).astype(np.float32),
+    }
+    return {"vocabulary": vocabulary}, arrays
+
+
+class EmbeddingIndex:
+    def __init__(self, version, meta: dict, arrays: dict):
+        self.version = version
+        self.vocabulary = {term: i for i, term in enumerate(meta["vocabulary"])}
+        self.pks = arrays["pk"]
+        self.idf = arrays["idf"]
+        self.components = arrays["components"]
+        self.embeddings = arrays["embeddings"]
+
+    def embed(self, text: str) -> np.ndarray | None:
+        """Unit vector of a text, None when it has no word of the catalog."""
+        counts = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term in terms(text or ""):
+            if term in self.vocabulary:
+                counts[self.vocabulary[term]] += 1
+        if not counts.any():
+            return None
+        vector = self.components @ (np.log1p(counts) * self.idf)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+
+    def similarity(self, text: str) -> np.ndarray | None:
+        """Cosine similarity of every site to a text."""
+        vector = self.embed(text)
+        return None if vector is None else self.embeddings @ vector
+
+    def top(self, text: str, n: int, pks=None) -> list | None:
+        """
+        Primary keys of the n sites closest to a text, best first, among
+        ``pks`` when given. None when the text says nothing the catalog
+        descriptions know about.
+        """
+        similarity = self.similarity(text)
+        if similarity is None:
+            return None
+        rows = np.arange(len(self.pks))
+        if pks is not None:
+            rows = rows[np.isin(self.pks, pks)]
+        order = np.lexsort((self.pks[rows], -similarity[rows]))[:n]
+        return self.pks[rows[order]].tolist()
+
+
+_indexes = {}
+
+
+def get_embedding_index(place_type: str) -> EmbeddingIndex:
+    """Per-process index of the current catalog version."""
+    model, _ = PLACE_FILTERS[place_type]
+    version = get_catalog_version(model)
+    index = _indexes.get(place_type)
+    if index is None or index.version != version:
+        meta, arrays = versioned_arrays(
+            f"embeddings-{model._meta.model_name}",
+            version,
+            lambda: embedding_columns(place_type),
+        )
+        index = _indexes[place_type] = EmbeddingIndex(version, meta, arrays)
+    return index
+
+
+def semantic_candidates(place_type: str, text: str, n: int, pks=None) -> list | None:
+    """
+    Primary keys of the n sites closest to a preference text, among ``pks``
+    when given, or None when the text does not narrow them.
+    """
+    if not n or not (text or "").strip():
+        return None
+    return get_embedding_index(place_type).top(text, n, pks) or None
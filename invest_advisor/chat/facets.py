@@ -0,0 +1,26 @@
+from invest_advisor.chat.filters import BUILDING_FILTERS, TECHNOPARK_FILTERS
+from invest_advisor.chat.models import BuildingModel, Technopark
+from invest_advisor.chat.services import (
+    TECHNOPARK_QUESTION_FIELDS,
+    facet_fields,
+    get_building_question_fields,
+)
+from invest_advisor.chat.snapshot import get_catalog_snapshot
+
+
+def get_technopark_facets(submission) -> dict:
+    """Options of the technopark wizard for the submission's technoparks."""
+    snapshot = get_catalog_snapshot(Technopark, TECHNOPARK_FILTERS)
+    return snapshot.facets(
+        snapshot.match(TECHNOPARK_FILTERS, submission),
+        *facet_fields(TECHNOPARK_QUESTION_FIELDS),
+    )
+
+
+def get_building_facets(submission) -> dict:
+    """Options of the building wizard for the submission's buildings."""
+    snapshot = get_catalog_snapshot(BuildingModel, BUILDING_FILTERS)
+    return snapshot.facets(
+        snapshot.match(BUILDING_FILTERS, submission),
+        *facet_fields(get_building_question_fields(None)),
+    )
@@ -0,0 +1,412 @@
+"""
+Declarative mapping from submission answers to catalog lookups.
+
+Every filter reads its answer from a submission with ``value()`` (None when the
+question is unanswered) and turns it into ORM lookups or tests it against a
+plain row dict, so the same spec drives the querysets, the wizard questions,
+in-memory matching and cache keys.
+"""
+import math
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Least, Power, Radians, Sin, Sqrt
+from django.db.models.lookups import LessThanOrEqual
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+
+class Filter:
+    when = None
+    # filters without a wizard question keep their number unused
+    question = True
+
+    def q(self, value) -> Q:
+        return Q(**self.lookups(value))
+
+
+class Exact(Filter):
+    type = "boolean"
+
+    def __init__(self, field, type=None, skip_blank=False, when=None):
+        self.field = self.name = field
+        self.type = type or self.type
+        self.skip_blank = skip_blank
+        self.when = when
+        self.submission_fields = [field]
+        self.model_fields = [field]
+
+    def value(self, submission):
+        if self.when and not getattr(submission, self.when, None):
+            return None
+        value = getattr(submission, self.field, None)
+        if self.skip_blank and not value:
+            return None
+        return value
+
+    def lookups(self, value) -> dict:
+        return {self.field: value}
+
+    def test(self, row, value) -> bool:
+        return row[self.field] == value
+
+
+class Range(Filter):
+    """min_<name>/max_<name> answers, paired ranges apply only when both are given."""
+
+    type = "range"
+
+    def __init__(self, name, model_fields=None, paired=False, when=None):
+        self.name = name
+        self.min_field, self.max_field = model_fields or (name, name)
+        self.paired = paired
+        self.when = when
+        self.submission_fields = [f"min_{name}", f"max_{name}"]
+        self.model_fields = [self.min_field, self.max_field]
+        self.gte = f"{self.min_field}__gte"
+        self.lte = f"{self.max_field}__lte"
+
+    def value(self, submission):
+        if self.when and not getattr(submission, self.when, None):
+            return None
+        min_value, max_value = (
+            getattr(submission, field, None) for field in self.submission_fields
+        )
+        if self.paired and (min_value is None or max_value is None):
+            return None
+        if min_value is None and max_value is None:
+            return None
+        return min_value, max_value
+
+    def lookups(self, value) -> dict:
+        min_value, max_value = value
+        lookups = {}
+        if min_value is not None:
+            lookups[self.gte] = min_value
+        if max_value is not None:
+            lookups[self.lte] = max_value
+        return lookups
+
+    def test(self, row, value) -> bool:
+        min_value, max_value = value
+        if min_value is not None and (
+            row[self.min_field] is None or row[self.min_field] < min_value
+        ):
+            return False
+        if max_value is not None and (
+            row[self.max_field] is None or row[self.max_field] > max_value
+        ):
+            return False
+        return True
+
+
+class Contains(Range):
+    """A single answer that has to fall into the [min, max] interval of a site."""
+
+    def __init__(self, name, model_fields, when=None):
+        super().__init__(name, model_fields, when=when)
+        self.submission_fields = [name]
+        self.gte = f"{self.max_field}__gte"
+        self.lte = f"{self.min_field}__lte"
+
+    def value(self, submission):
+        if self.when and not getattr(submission, self.when, None):
+            return None
+        return getattr(submission, self.submission_fields[0], None)
+
+    def lookups(self, value) -> dict:
+        return {self.lte: value, self.gte: value}
+
+    def test(self, row, value) -> bool:
+        return (
+            row[self.min_field] is not None
+            and row[self.max_field] is not None
+            and row[self.min_field] <= value <= row[self.max_field]
+        )
+
+
+class Overlap(Filter):
+    type = "array"
+
+    def __init__(self, field, when=None):
+        self.field = self.name = field
+        self.when = when
+        self.submission_fields = [field]
+        self.model_fields = [field]
+        self.overlap = f"{field}__overlap"
+
+    def value(self, submission):
+        if self.when and not getattr(submission, self.when, None):
+            return None
+        return getattr(submission, self.field, None) or None
+
+    def lookups(self, value) -> dict:
+        return {self.overlap: value}
+
+    def test(self, row, value) -> bool:
+        return not set(row[self.field] or []).isdisjoint(value)
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1))
+
+
+def distance_km(lat_field, lon_field, lat, lon):
+    """haversine_km from a point to the coordinates of a row, as an expression."""
+    row_lat = Radians(Cast(lat_field, FloatField()))
+    row_lon = Radians(Cast(lon_field, FloatField()))
+    lat, lon = math.radians(lat), math.radians(lon)
+    half_dlat = Sin((row_lat - Value(lat)) / 2)
+    half_dlon = Sin((row_lon - Value(lon)) / 2)
+    a = Power(half_dlat, 2) + Cos(row_lat) * Value(math.cos(lat)) * Power(half_dlon, 2)
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Least(Sqrt(a), Value(1.0)))
+
+
+class Near(Filter):
+    """
+    Sites within radius_km of the near_lat/near_lon point. A bounding box on
+    the indexed coordinate columns narrows the rows the exact distance is
+    computed for.
+    """
+
+    type = "near"
+    name = "near"
+    question = False
+
+    def __init__(self, lat_field, lon_field):
+        self.lat_field = lat_field
+        self.lon_field = lon_field
+        self.submission_fields = ["near_lat", "near_lon", "radius_km"]
+        self.model_fields = [lat_field, lon_field]
+
+    def value(self, submission):
+        lat, lon, radius = (
+            getattr(submission, field, None) for field in self.submission_fields
+        )
+        if lat is None or lon is None or not radius or radius <= 0:
+            return None
+        return float(lat), float(lon), float(radius)
+
+    def lookups(self, value) -> dict:
+        lat, lon, radius = value
+        delta_lat = radius / KM_PER_DEGREE
+        lookups = {
+            f"{self.lat_field}__gte": lat - delta_lat,
+            f"{self.lat_field}__lte": lat + delta_lat,
+        }
+        cos_lat = math.cos(math.radians(min(abs(lat) + delta_lat, 90)))
+        delta_lon = delta_lat / cos_lat if cos_lat > 1e-6 else 360
+        # no longitude bounds around the poles and across the antimeridian
+        if -180 <= lon - delta_lon and lon + delta_lon <= 180:
+            lookups[f"{self.lon_field}__gte"] = lon - delta_lon
+            lookups[f"{self.lon_field}__lte"] = lon + delta_lon
+        return lookups
+
+    def distance(self, lat, lon):
+        return distance_km(self.lat_field, self.lon_field, lat, lon)
+
+    def q(self, value) -> Q:
+        lat, lon, radius = value
+        return Q(**self.lookups(value)) & Q(
+            LessThanOrEqual(self.distance(lat, lon), radius)
+        )
+
+    def test(self, row, value) -> bool:
+        lat, lon, radius = value
+        if row[self.lat_field] is None or row[self.lon_field] is None:
+            return False
+        row_lat, row_lon = float(row[self.lat_field]), float(row[self.lon_field])
+        return haversine_km(lat, lon, row_lat, row_lon) <= radius
+
+
+class Search(Filter):
+    """
+    Russian full-text search of the long text fields of a site, through the
+    GIN-indexed search_vector column. There is no in-memory test, the
+    matching primary keys come from the database.
+    """
+
+    type = "search"
+    name = "search"
+    question = False
+    config = "russian"
+
+    def __init__(self, field="search_query"):
+        self.field = field
+        self.submission_fields = [field]
+        self.model_fields = []
+
+    def value(self, submission):
+        return (getattr(submission, self.field, None) or "").strip() or None
+
+    def query(self, value) -> SearchQuery:
+        return SearchQuery(value, config=self.config, search_type="websearch")
+
+    def lookups(self, value) -> dict:
+        return {"search_vector": self.query(value)}
+
+    def rank(self, value):
+        return SearchRank(F("search_vector"), self.query(value))
+
+    def pks(self, model, value) -> list:
+        return list(
+            model.objects.filter(**self.lookups(value)).values_list("pk", flat=True)
+        )
+
+
+# Questions of the wizards are asked in this order
+TECHNOPARK_FILTERS = [
+    Exact("region", type="string", skip_blank=True),
+    Range("num_residents"),
+    Range("year_of_object_forming"),
+    Range("total_square"),
+    Range("minimal_cost_of_buy"),
+    Overlap("list_of_activities"),
+    Overlap("infrastructure"),
+    Range("tax_income"),
+    Range("tax_estate"),
+    Range("tax_ground"),
+    Range("tax_transport"),
+    Range("insurance_premiums"),
+    Exact("free_custom_zone"),
+    Range("minimal_investment_volume"),
+    Near("coords_lat", "coords_lon"),
+    Search(),
+]
+
+BUILDING_FILTERS = [
+    Exact("pref_treatment"),
+    Exact("region", type="string", skip_blank=True),
+    Overlap("site_format"),
+    Overlap("site_type"),
+    Overlap("transaction_form"),
+    Range("cost_object"),
+    Exact("water_supply_available"),
+    Range(
+        "water_supply_rate_consumption",
+        model_fields=(
+            "water_supply_rate_consumption_min",
+            "water_supply_rate_consumption_max",
+        ),
+        paired=True,
+        when="water_supply_available",
+    ),
+    Range(
+        "water_supply_objects_max_capacity",
+        paired=True,
+        when="water_supply_available",
+    ),
+    Exact("gas_supply_available"),
+    Contains(
+        "gas_supply_rate_consumption",
+        model_fields=(
+            "gas_supply_rate_consumption_min",
+            "gas_supply_rate_consumption_max",
+        ),
+        when="gas_supply_available",
+    ),
+    Range("gas_supply_rate_transport", paired=True, when="gas_supply_available"),
+    Exact("electricity_supply_available"),
+    Range(
+        "electricity_rate_consumption",
+        model_fields=(
+            "electricity_rate_consumption_min",
+            "electricity_rate_consumption_max",
+        ),
+        paired=True,
+        when="electricity_supply_available",
+    ),
+    Range(
+        "electricity_rate_transport",
+        paired=True,
+        when="electricity_supply_available",
+    ),
+    Exact("heating_available"),
+    Range("heating_rate_consumption", paired=True, when="heating_available"),
+    Range("heating_rate_transport", paired=True, when="heating_available"),
+    Exact("waste_disposal_available"),
+    Exact("access_roads_available"),
+    Exact("railways_available"),
+    Exact("truck_parking_available"),
+    Near("coordinates_lat", "coordinates_lon"),
+    Search(),
+]
+
+
+def compile_filters(spec):
+    """Build a submission -> Q function once, calls only read the answers."""
+    compiled = [(spec_filter.value, spec_filter.q) for spec_filter in spec]
+
+    def build_q(submission) -> Q:
+        q = Q()
+        for value_of, q_of in compiled:
+            value = value_of(submission)
+            if value is not None:
+                q &= q_of(value)
+        return q
+
+    return build_q
+
+
+def matches(spec, submission, row: dict) -> bool:
+    """In-memory equivalent of filtering by the compiled Q."""
+    for spec_filter in spec:
+        value = spec_filter.value(submission)
+        if value is not None and not spec_filter.test(row, value):
+            return False
+    return True
+
+
+def order_by_search(places, spec, submission):
+    """Sites best matching the full-text search of the submission first."""
+    for spec_filter in spec:
+        if isinstance(spec_filter, Search):
+            value = spec_filter.value(submission)
+            if value is not None:
+                return places.annotate(search_rank=spec_filter.rank(value)).order_by(
+                    "-search_rank", "pk"
+                )
+    return places
+
+
+def model_fields(spec) -> list[str]:
+    return list(dict.fromkeys(f for s in spec for f in s.model_fields))
+
+
+def question_fields(spec, submission) -> dict:
+    """
+    Wizard questions numbered from 1 in spec order. Questions gated by a
+    yes/no answer (``when``) are skipped when that answer is not yes.
+    """
+    questions = {}
+    for number, spec_filter in enumerate(spec, 1):
+        if not spec_filter.question:
+            continue
+        next_question = number + 1
+        if isinstance(spec_filter, Exact) and not getattr(
+            submission, spec_filter.field, None
+        ):
+            while (
+                next_question <= len(spec)
+                and spec[next_question - 1].when == spec_filter.field
+            ):
+                next_question += 1
+        field = spec_filter.model_fields
+        if spec_filter.type != "range":
+            field = field[0]
+        questions[number] = {
+            "field": field,
+            "type": spec_filter.type,
+            "next": next_question,
+        }
+    return questions
+
+
+technopark_q = compile_filters(TECHNOPARK_FILTERS)
+building_q = compile_filters(BUILDING_FILTERS)
@@ -0,0 +1,308 @@
+"""
+Catalog import from the xlsx exports in ``data/``.
+
+Every model field is read from one spreadsheet column and cleaned column at a
+time with pandas; rows are only materialized as model instances for
+bulk_create/bulk_update.
+"""
+import hashlib
+import json
+
+import pandas as pd
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.db import models, transaction
+
+from invest_advisor.chat.catalog import bump_catalog_version, update_search_vectors
+from invest_advisor.chat.models import BuildingModel, Technopark
+from invest_advisor.chat.services import PLACE_FILTERS
+from invest_advisor.chat.tasks import build_catalog_index
+
+NUMBER = r"(\d+(?:[.,]\d+)?)"
+
+
+def to_text(column: pd.Series) -> pd.Series:
+    text = column.astype("string").str.strip()
+    return text.mask(text == "")
+
+
+def to_number(column: pd.Series) -> pd.Series:
+    text = to_text(column).str.replace(r"\s", "", regex=True).str.replace(",", ".")
+    return pd.to_numeric(text, errors="coerce")
+
+
+def to_int(column: pd.Series) -> pd.Series:
+    return to_number(column).round().astype("Int64")
+
+
+def yes_no(column: pd.Series) -> pd.Series:
+    """ "Да" is True, any other answer ("Нет", "Возможно создание") is False."""
+    return to_text(column).str.lower().eq("да")
+
+
+def split_list(column: pd.Series, sep=";", prefix=None) -> pd.Series:
+    items = to_text(column).str.split(sep).explode().str.strip()
+    if prefix:
+        items = items.str.replace(prefix, "", regex=True).str.strip()
+    lists = items[items.fillna("") != ""].groupby(level=0).agg(list)
+    return lists.reindex(column.index).apply(
+        lambda value: value if isinstance(value, list) else []
+    )
+
+
+def range_bounds(column: pd.Series) -> tuple[pd.Series, pd.Series]:
+    """ "от X до Y" as (X, Y), a single number as (X, X)."""
+    bounds = to_text(column).str.extract(rf"от\s*{NUMBER}\s*до\s*{NUMBER}")
+    single = to_number(column)
+    return to_number(bounds[0]).fillna(single), to_number(bounds[1]).fillna(single)
+
+
+def range_min(column: pd.Series) -> pd.Series:
+    return range_bounds(column)[0]
+
+
+def range_max(column: pd.Series) -> pd.Series:
+    return range_bounds(column)[1]
+
+
+def percent(column: pd.Series) -> pd.Series:
+    """ "16,5 %" as 0.165, values with any other text are dropped."""
+    return to_number(to_text(column).str.extract(rf"^{NUMBER}\s*%?$")[0]) / 100
+
+
+def last_number(column: pd.Series) -> pd.Series:
+    """Year of a date or a plain number: "31.12.2054" -> 2054."""
+    return to_int(to_text(column).str.extract(r"(\d+)$")[0])
+
+
+def coordinate(index: int):
+    """Coordinates are stored as "lon,lat"."""
+
+    def convert(column: pd.Series) -> pd.Series:
+        return to_number(to_text(column).str.split(",").str[index])
+
+    return convert
+
+
+def inn(column: pd.Series) -> pd.Series:
+    return to_int(column).astype("string")
+
+
+def default_converter(field):
+    if isinstance(field, ArrayField):
+        return split_list
+    if isinstance(field, models.BooleanField):
+        return yes_no
+    if isinstance(field, models.IntegerField):
+        return to_int
+    if isinstance(field, (models.DecimalField, models.FloatField)):
+        return to_number
+    return to_text
+
+
+def field_columns(model, overrides: dict) -> dict:
+    """
+    field name -> (column, converter). Columns default to the verbose_name of
+    the field, converters to its type.
+    """
+    columns = {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key or not field.editable:
+            continue
+        column, converter = overrides.get(field.name, (None, None))
+        columns[field.name] = (
+            column or str(field.verbose_name),
+            converter or default_converter(field),
+        )
+    return columns
+
+
+TECHNOPARK_COLUMNS = field_columns(
+    Technopark,
+    {
+        "oez": ("ОЭЗ", None),
+        "nearest_region": ("Ближайший город", None),
+        "documents": ("Документы по объекту", None),
+        "year_of_object_destroy": (None, last_number),
+        "list_of_activities": (
+            "Список отраслей",
+            lambda column: split_list(column, ";", r"^[\d.]+\s*-\s*"),
+        ),
+        "infrastructure": (None, lambda column: split_list(column, "\n", r"^•\s*")),
+        "link": ("Ссылка на сайт", None),
+        "tax_income": (None, percent),
+        "tax_estate": (None, percent),
+        "tax_ground": (None, percent),
+        "tax_transport": (None, percent),
+        "insurance_premiums": (None, percent),
+        "how_to_become_resident": (
+            None,
+            lambda column: to_text(column).fillna(""),
+        ),
+        "minimal_investment_volume": ("Минимальный объем инвестиций, руб.", None),
+        "coords_lat": ("Координаты (точка)", coordinate(1)),
+        "coords_lon": ("Координаты (точка)", coordinate(0)),
+    },
+)
+
+LEASE_TERM_COLUMN = "min и max сроки аренды (если применимо), лет"
+WATER_CONSUMPTION_COLUMN = "Водоснабжение Тариф на потребление, руб./куб. м"
+WATER_TRANSPORT_COLUMN = "Водоснабжение Тариф на транспортировку, руб./куб. м"
+GAS_CONSUMPTION_COLUMN = "Газоснабжение Тариф на потребление, руб./куб. м"
+ELECTRICITY_CONSUMPTION_COLUMN = "Электроснабжение Тариф на потребление, руб./МВт*ч"
+
+BUILDING_COLUMNS = field_columns(
+    BuildingModel,
+    {
+        "lease_term_min": (LEASE_TERM_COLUMN, range_min),
+        "lease_term_max": (LEASE_TERM_COLUMN, range_max),
+        "owner_inn": (None, inn),
+        "water_supply_rate_consumption_min": (WATER_CONSUMPTION_COLUMN, range_min),
+        "water_supply_rate_consumption_max": (WATER_CONSUMPTION_COLUMN, range_max),
+        "water_supply_rate_transport_min": (WATER_TRANSPORT_COLUMN, range_min),
+        "water_supply_rate_transport_max": (WATER_TRANSPORT_COLUMN, range_max),
+        "water_supply_objects_max_capacity": (
+            "Объекты водоснабжения Максимально допустимая мощность, куб. м/ч",
+            None,
+        ),
+        "gas_supply_rate_consumption_min": (GAS_CONSUMPTION_COLUMN, range_min),
+        "gas_supply_rate_consumption_max": (GAS_CONSUMPTION_COLUMN, range_max),
+        "gas_supply_objects_max_capacity": (
+            "Объекты газоснабжения Максимально допустимая мощность, куб. м./ч",
+            None,
+        ),
+        "electricity_rate_consumption_min": (
+            ELECTRICITY_CONSUMPTION_COLUMN,
+            range_min,
+        ),
+        "electricity_rate_consumption_max": (
+            ELECTRICITY_CONSUMPTION_COLUMN,
+            range_max,
+        ),
+        "electricity_rate_transport": (
+            "Электроснабжение Тариф на транспортировку, руб./МВт*ч",
+            None,
+        ),
+        "electricity_objects_max_capacity": (
+            "Объекты электроснабжения Максимально допустимая мощность, МВт/ч",
+            None,
+        ),
+        "heating_rate_consumption": (
+            "Теплоснабжение Тариф на потребление, руб./Гкал*ч",
+            None,
+        ),
+        "heating_objects_max_capacity": (
+            "Объекты теплоснабжения Максимально допустимая мощность, Гкал/ч",
+            None,
+        ),
+        "sewage_objects_max_capacity": (
+            "Объекты водоотведения Максимально допустимая мощность, куб. м/ч",
+            None,
+        ),
+        "coordinates_lat": ("Координаты (точка)", coordinate(1)),
+        "coordinates_lon": ("Координаты (точка)", coordinate(0)),
+    },
+)
+
+# Upsert keys, there is no unique column in the exports
+TECHNOPARK_KEY = ["name"]
+BUILDING_KEY = ["name", "cadastral_number_building", "cadastral_number_land"]
+
+
+def clean_frame(df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """Model field values of every spreadsheet row, missing values as None."""
+    frame = pd.DataFrame(index=df.index)
+    for field, (column, converter) in columns.items():
+        if column in df:
+            frame[field] = converter(df[column])
+        else:
+            frame[field] = None
+    frame = frame.astype(object)
+    return frame.where(frame.notna(), None)
+
+
+def read_catalog(model, file_path) -> pd.DataFrame:
+    columns = TECHNOPARK_COLUMNS if model is Technopark else BUILDING_COLUMNS
+    return clean_frame(pd.read_excel(file_path), columns)
+
+
+def row_hash(row: dict) -> str:
+    return hashlib.sha1(
+        json.dumps(row, sort_keys=True, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
+
+
+def save_catalog(
+    model, frame: pd.DataFrame, key=None, delete=False, chunk_size=500
+) -> dict:
+    """
+    Write cleaned rows in one transaction, every row stores the hash of its
+    source values. Without a key all rows are inserted. With a key (list of
+    fields) a row matching an existing object updates it, only when its hash
+    changed; the last of the rows sharing a key wins. With delete objects
+    whose key is missing from the rows are deleted, so the table mirrors the
+    export. Search vectors of the written rows are recomputed, the catalog
+    version is bumped only if something was written.
+    """
+    counts = {"created": 0, "updated": 0, "deleted": 0, "unchanged": 0, "skipped": 0}
+    fields = list(frame.columns) + ["source_hash"]
+    with transaction.atomic():
+        existing, stale = {}, []
+        if key:
+            duplicated = frame.duplicated(subset=key, keep="last")
+            counts["skipped"] = int(duplicated.sum())
+            frame = frame[~duplicated]
+            for *values, pk, source_hash in model.objects.order_by("pk").values_list(
+                *key, "pk", "source_hash"
+            ):
+                if tuple(values) in existing:
+                    stale.append(pk)
+                else:
+                    existing[tuple(values)] = pk, source_hash
+
+        created, updated = [], []
+        for row in frame.to_dict("records"):
+            source_hash = row_hash(row)
+            pk, stored_hash = (
+                existing.pop(tuple(row[field] for field in key), (None, None))
+                if key
+                else (None, None)
+            )
+            if pk is None:
+                created.append(model(source_hash=source_hash, **row))
+            elif stored_hash != source_hash:
+                updated.append(model(pk=pk, source_hash=source_hash, **row))
+            else:
+                counts["unchanged"] += 1
+        model.objects.bulk_create(created, batch_size=chunk_size)
+        model.objects.bulk_update(updated, fields, batch_size=chunk_size)
+        update_search_vectors(model, [row.pk for row in created + updated])
+        counts["created"], counts["updated"] = len(created), len(updated)
+        if delete:
+            stale += [pk for pk, _ in existing.values()]
+            model.objects.filter(pk__in=stale).delete()
+            counts["deleted"] = len(stale)
+
+        if counts["created"] or counts["updated"] or counts["deleted"]:
+            # bulk operations skip the post_save signals
+            transaction.on_commit(lambda: catalog_imported(model))
+    return counts
+
+
+def catalog_imported(model):
+    bump_catalog_version(model)
+    if settings.CATALOG_SNAPSHOT_DIR:
+        # built once by a worker instead of by the first task of the version
+        place_type = next(t for t, (m, _) in PLACE_FILTERS.items() if m is model)
+        build_catalog_index.delay(place_type)
+
+
+def import_catalog(model, file_path, upsert=False, sync=False, chunk_size=500) -> dict:
+    """
+    Append the rows of an export, or with upsert update matching objects too.
+    sync additionally deletes objects that are not in the export anymore.
+    """
+    key = None
+    if upsert or sync:
+        key = TECHNOPARK_KEY if model is Technopark else BUILDING_KEY
+    return save_catalog(model, read_catalog(model, file_path), key, sync, chunk_size)
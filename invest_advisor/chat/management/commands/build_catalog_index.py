@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from invest_advisor.chat.embeddings import get_embedding_index
+from invest_advisor.chat.services import PLACE_FILTERS
+from invest_advisor.chat.snapshot import get_catalog_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the catalog snapshots and embedding indexes of the current catalog "
+        "versions ahead of the first request, e.g. right after an import"
+    )
+
+    def handle(self, *args, **options):
+        for place_type, (model, spec) in PLACE_FILTERS.items():
+            snapshot = get_catalog_snapshot(model, spec)
+            index = get_embedding_index(place_type)
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: {snapshot.size} rows, "
+                f"{index.embeddings.shape[1]} dimensions, "
+                f"{len(index.vocabulary)} terms (version {snapshot.version})"
+            )
@@ -0,0 +1,91 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from invest_advisor.chat.filters import building_q, technopark_q
+from invest_advisor.chat.models import (
+    BuildingModel,
+    BuildingSubmission,
+    Technopark,
+    TechnoparkSubmission,
+)
+
+
+def most_common(queryset, field):
+    """Most frequent value of a field, array fields count every element."""
+    counter = Counter()
+    for value in queryset.exclude(**{f"{field}__isnull": True}).values_list(
+        field, flat=True
+    ):
+        counter.update(value if isinstance(value, list) else [value])
+    return counter.most_common(1)[0][0] if counter else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Print query plans of the technopark_q/building_q filters for typical "
+        "submissions, e.g. to check that the catalog indexes are used"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyze", action="store_true", help="Run EXPLAIN ANALYZE"
+        )
+        parser.add_argument(
+            "--submission",
+            action="append",
+            default=[],
+            help="Also explain a stored technopark or building submission by id",
+        )
+
+    def handle(self, *args, **options):
+        region = most_common(Technopark.objects.all(), "region")
+        technopark_submissions = {
+            "empty": TechnoparkSubmission(),
+            "region": TechnoparkSubmission(region=region),
+            "activities": TechnoparkSubmission(
+                list_of_activities=[
+                    most_common(Technopark.objects.all(), "list_of_activities")
+                ],
+                infrastructure=[
+                    most_common(Technopark.objects.all(), "infrastructure")
+                ],
+            ),
+            "taxes": TechnoparkSubmission(
+                region=region, max_tax_income=0, max_tax_estate=0
+            ),
+        }
+        region = most_common(BuildingModel.objects.all(), "region")
+        building_submissions = {
+            "empty": BuildingSubmission(),
+            "region": BuildingSubmission(region=region),
+            "arrays": BuildingSubmission(
+                site_format=[most_common(BuildingModel.objects.all(), "site_format")],
+                transaction_form=[
+                    most_common(BuildingModel.objects.all(), "transaction_form")
+                ],
+            ),
+            "cost": BuildingSubmission(
+                region=region, min_cost_object=0, max_cost_object=10_000_000
+            ),
+        }
+        for submission_id in options["submission"]:
+            submission = TechnoparkSubmission.objects.filter(id=submission_id).first()
+            if submission:
+                technopark_submissions[submission_id] = submission
+                continue
+            building_submissions[submission_id] = BuildingSubmission.objects.get(
+                id=submission_id
+            )
+
+        for name, submission in technopark_submissions.items():
+            technoparks = Technopark.objects.filter(technopark_q(submission))
+            self.explain(f"technopark: {name}", technoparks, options)
+        for name, submission in building_submissions.items():
+            buildings = BuildingModel.objects.filter(building_q(submission))
+            self.explain(f"building: {name}", buildings, options)
+
+    def explain(self, title, queryset, options):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(queryset.explain(analyze=options["analyze"]))
+        self.stdout.write("")
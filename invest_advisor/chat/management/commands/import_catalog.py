@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from invest_advisor.chat.importers import import_catalog
+from invest_advisor.chat.models import BuildingModel, Technopark
+
+
+class Command(BaseCommand):
+    help = "Import technoparks and buildings from the xlsx exports"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--technoparks", help="Path to the technoparks xlsx")
+        parser.add_argument("--buildings", help="Path to the buildings xlsx")
+        parser.add_argument(
+            "--upsert",
+            action="store_true",
+            help="Update objects with the same name (and cadastral numbers for buildings)",
+        )
+        parser.add_argument(
+            "--sync",
+            action="store_true",
+            help="Upsert, then delete objects missing from the files",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        files = {
+            Technopark: options["technoparks"],
+            BuildingModel: options["buildings"],
+        }
+        if not any(files.values()):
+            files = {
+                Technopark: settings.ROOT_DIR / "data" / "cleared_technoparks.xlsx",
+                BuildingModel: settings.ROOT_DIR / "data" / "cleared_buildings.xlsx",
+            }
+        for model, file_path in files.items():
+            if not file_path:
+                continue
+            counts = import_catalog(
+                model,
+                file_path,
+                upsert=options["upsert"],
+                sync=options["sync"],
+                chunk_size=options["chunk_size"],
+            )
+            self.stdout.write(
+                f"{model._meta.verbose_name_plural}: "
+                + ", ".join(f"{name} {count}" for name, count in counts.items())
+            )
+        # the indexes of this host, the workers build theirs from the import
+        call_command("build_catalog_index", stdout=self.stdout)
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:47
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "chat",
+            "0016_remove_buildingsubmission_water_supply_rate_consumption_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="buildingmodel",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["site_format"], name="building_site_format_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="buildingmodel",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["site_type"], name="building_site_type_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="buildingmodel",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["transaction_form"], name="building_transaction_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="buildingmodel",
+            index=models.Index(
+                fields=["region", "cost_object"], name="building_region_cost_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="buildingmodel",
+            index=models.Index(fields=["cost_object"], name="building_cost_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="technopark",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["list_of_activities"], name="technopark_activities_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="technopark",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["infrastructure"], name="technopark_infra_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="technopark",
+            index=models.Index(fields=["region"], name="technopark_region_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="technopark",
+            index=models.Index(
+                fields=["tax_income", "tax_estate", "tax_ground"],
+                name="technopark_taxes_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="technopark",
+            index=models.Index(
+                fields=["minimal_cost_of_buy"], name="technopark_cost_of_buy_idx"
+            ),
+        ),
+    ]
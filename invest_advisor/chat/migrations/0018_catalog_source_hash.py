@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0017_catalog_filter_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildingmodel",
+            name="source_hash",
+            field=models.CharField(
+                editable=False,
+                max_length=40,
+                null=True,
+                verbose_name="Хеш строки импорта",
+            ),
+        ),
+        migrations.AddField(
+            model_name="technopark",
+            name="source_hash",
+            field=models.CharField(
+                editable=False,
+                max_length=40,
+                null=True,
+                verbose_name="Хеш строки импорта",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0018_catalog_source_hash"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="chatmessage",
+            index=models.Index(
+                fields=["chat", "created", "id"], name="chat_message_created_idx"
+            ),
+        ),
+    ]
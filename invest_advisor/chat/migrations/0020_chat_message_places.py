@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:07
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0019_chat_message_created_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatmessage",
+            name="place_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(),
+                blank=True,
+                null=True,
+                size=None,
+                verbose_name="Объекты",
+            ),
+        ),
+        migrations.AddField(
+            model_name="chatmessage",
+            name="place_type",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("technopark", "Технопарк"),
+                    ("building", "Объект недвижимости"),
+                ],
+                max_length=20,
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,113 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import migrations
+
+# Models and table columns of the snapshots stored in ChatMessage.data
+PLACE_TABLES = {
+    "technopark": (
+        "Technopark",
+        [
+            "name",
+            "type",
+            "minimal_cost_of_buy",
+            "link",
+            "tax_income",
+            "tax_estate",
+            "tax_ground",
+            "insurance_premiums",
+        ],
+    ),
+    "building": (
+        "BuildingModel",
+        [
+            "name",
+            "pref_treatment",
+            "support_infra_object",
+            "municipal_entity",
+            "site_format",
+            "ownership_form",
+            "transaction_form",
+            "cost_object",
+        ],
+    ),
+}
+
+BATCH_SIZE = 500
+
+
+def is_table(data) -> bool:
+    return isinstance(data, list) and all(
+        isinstance(row, dict) and "name" in row for row in data
+    )
+
+
+def normalize_places(apps, schema_editor):
+    """
+    Replace table snapshots with the primary keys of the places they were
+    built from. Snapshots naming a place that no longer exists are kept.
+    """
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    pks_by_name = {}
+    for place_type, (model_name, _) in PLACE_TABLES.items():
+        pks = defaultdict(list)
+        model = apps.get_model("chat", model_name)
+        for pk, name in model.objects.order_by("pk").values_list("pk", "name"):
+            pks[name].append(pk)
+        pks_by_name[place_type] = pks
+
+    messages = ChatMessage.objects.filter(
+        data__isnull=False, place_ids__isnull=True, chat__isnull=False
+    ).select_related("chat")
+    batch = []
+    for message in messages.iterator(chunk_size=BATCH_SIZE):
+        pks = pks_by_name.get(message.chat.type)
+        if pks is None or not is_table(message.data):
+            continue
+        if not all(row["name"] in pks for row in message.data):
+            continue
+        message.place_type = message.chat.type
+        message.place_ids = list(
+            dict.fromkeys(pk for row in message.data for pk in pks[row["name"]])
+        )
+        message.data = None
+        batch.append(message)
+        if len(batch) >= BATCH_SIZE:
+            ChatMessage.objects.bulk_update(batch, ["place_type", "place_ids", "data"])
+            batch = []
+    ChatMessage.objects.bulk_update(batch, ["place_type", "place_ids", "data"])
+
+
+def json_value(value):
+    # DRF renders decimals as strings
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def denormalize_places(apps, schema_editor):
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    batch = []
+    messages = ChatMessage.objects.filter(place_ids__isnull=False)
+    for message in messages.iterator(chunk_size=BATCH_SIZE):
+        model_name, fields = PLACE_TABLES[message.place_type]
+        rows = apps.get_model("chat", model_name).objects.in_bulk(message.place_ids)
+        message.data = [
+            {field: json_value(getattr(rows[pk], field)) for field in fields}
+            for pk in message.place_ids
+            if pk in rows
+        ]
+        message.place_type = message.place_ids = None
+        batch.append(message)
+        if len(batch) >= BATCH_SIZE:
+            ChatMessage.objects.bulk_update(batch, ["place_type", "place_ids", "data"])
+            batch = []
+    ChatMessage.objects.bulk_update(batch, ["place_type", "place_ids", "data"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0020_chat_message_places"),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_places, denormalize_places),
+    ]
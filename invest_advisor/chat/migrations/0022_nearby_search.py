@@ -0,0 +1,68 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0021_normalize_chat_message_data"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildingsubmission",
+            name="near_lat",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="Широта точки поиска"
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildingsubmission",
+            name="near_lon",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="Долгота точки поиска"
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildingsubmission",
+            name="radius_km",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="Радиус поиска, км"
+            ),
+        ),
+        migrations.AddField(
+            model_name="technoparksubmission",
+            name="near_lat",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="Широта точки поиска"
+            ),
+        ),
+        migrations.AddField(
+            model_name="technoparksubmission",
+            name="near_lon",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="Долгота точки поиска"
+            ),
+        ),
+        migrations.AddField(
+            model_name="technoparksubmission",
+            name="radius_km",
+            field=models.FloatField(
+                blank=True, null=True, verbose_name="Радиус поиска, км"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="buildingmodel",
+            index=models.Index(
+                fields=["coordinates_lat", "coordinates_lon"],
+                name="building_coordinates_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="technopark",
+            index=models.Index(
+                fields=["coords_lat", "coords_lon"], name="technopark_coords_idx"
+            ),
+        ),
+    ]
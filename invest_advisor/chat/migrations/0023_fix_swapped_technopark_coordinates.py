@@ -0,0 +1,23 @@
+from django.db import migrations
+from django.db.models import F, Q
+
+# Catalog sites are in Russia, between 41 and 82 degrees north. Rows loaded
+# from the old data.json fixture have longitude and latitude swapped.
+SWAPPED = Q(coords_lat__lt=41, coords_lon__gte=41, coords_lon__lte=82)
+
+
+def swap_coordinates(apps, schema_editor):
+    Technopark = apps.get_model("chat", "Technopark")
+    Technopark.objects.filter(SWAPPED).update(
+        coords_lat=F("coords_lon"), coords_lon=F("coords_lat")
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("chat", "0022_nearby_search"),
+    ]
+
+    operations = [
+        migrations.RunPython(swap_coordinates, migrations.RunPython.noop),
+    ]
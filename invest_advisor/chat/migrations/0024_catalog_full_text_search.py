@@ -0,0 +1,92 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:24
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+# catalog.SEARCH_FIELDS at the time of this migration
+SEARCH_FIELDS = {
+    "Technopark": ["restrictions", "additional_infra", "another_benefits"],
+    "BuildingModel": [
+        "building_characteristics",
+        "permitted_use_options",
+        "building_technical_characteristics",
+        "possible_activities",
+        "other_characteristics",
+        "benefit_description",
+        "note",
+        "water_supply_other_characteristics",
+        "sewage_other_characteristics",
+        "gas_supply_other_characteristics",
+        "electricity_other_characteristics",
+        "heating_other_characteristics",
+        "urban_planning_characteristics",
+        "other_information",
+    ],
+}
+
+
+def fill_search_vectors(apps, schema_editor):
+    for model_name, fields in SEARCH_FIELDS.items():
+        apps.get_model("chat", model_name).objects.update(
+            search_vector=SearchVector("name", weight="A", config="russian")
+            + SearchVector(*fields, weight="B", config="russian")
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0023_fix_swapped_technopark_coordinates"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="buildingmodel",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="buildingsubmission",
+            name="search_query",
+            field=models.CharField(
+                blank=True,
+                max_length=500,
+                null=True,
+                verbose_name="Поиск по описанию объекта",
+            ),
+        ),
+        migrations.AddField(
+            model_name="technopark",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="technoparksubmission",
+            name="search_query",
+            field=models.CharField(
+                blank=True,
+                max_length=500,
+                null=True,
+                verbose_name="Поиск по описанию объекта",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="buildingmodel",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="building_search_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="technopark",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="technopark_search_gin"
+            ),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,332 @@
+import json
+import os
+import re
+import time
+from collections.abc import Iterable, Iterator
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+
+CONVERSATION = "conversation"
+CONVERSATION_BATCH = "conversation_batch"
+MESSAGE = "message"
+ADVICE_AND_SUPPORT = "advice_and_support"
+GENERATE_NAME = "generate_name"
+
+ENDPOINTS = [
+    CONVERSATION,
+    CONVERSATION_BATCH,
+    MESSAGE,
+    ADVICE_AND_SUPPORT,
+    GENERATE_NAME,
+]
+
+_session = None
+_session_pid = None
+
+
+class MLError(Exception):
+    pass
+
+
+def get_session() -> requests.Session:
+    """One keep-alive session per worker process, recreated after fork."""
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.ML_POOL_SIZE,
+            pool_block=True,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Connection"] = "keep-alive"
+        _session, _session_pid = session, os.getpid()
+    return _session
+
+
+def _record_latency(endpoint: str, elapsed: float, failed: bool):
+    prefix = f"ml_latency:{endpoint}"
+    for key, value in [
+        ("count", 1),
+        ("total_ms", int(elapsed * 1000)),
+        ("errors", int(failed)),
+    ]:
+        if value and not cache.add(f"{prefix}:{key}", value, None):
+            cache.incr(f"{prefix}:{key}", value)
+    max_ms = cache.get(f"{prefix}:max_ms") or 0
+    if elapsed * 1000 > max_ms:
+        cache.set(f"{prefix}:max_ms", int(elapsed * 1000), None)
+
+
+def get_latency_stats() -> dict:
+    """Latency counters of every ML endpoint, aggregated over all processes."""
+    stats = {}
+    for endpoint in ENDPOINTS:
+        prefix = f"ml_latency:{endpoint}"
+        values = cache.get_many(
+            [f"{prefix}:{key}" for key in ["count", "total_ms", "max_ms", "errors"]]
+        )
+        count = values.get(f"{prefix}:count", 0)
+        total_ms = values.get(f"{prefix}:total_ms", 0)
+        stats[endpoint] = {
+            "count": count,
+            "errors": values.get(f"{prefix}:errors", 0),
+            "avg_ms": total_ms / count if count else None,
+            "max_ms": values.get(f"{prefix}:max_ms"),
+        }
+    return stats
+
+
+def read_reply(r: requests.Response) -> bytes:
+    """Body of a streamed reply, refusing to read more than ML_MAX_REPLY_SIZE bytes."""
+    limit = settings.ML_MAX_REPLY_SIZE
+    if int(r.headers.get("Content-Length") or 0) > limit:
+        raise MLError(f"ML reply is larger than {limit} bytes")
+    body = r.raw.read(limit + 1, decode_content=True)
+    if len(body) > limit:
+        raise MLError(f"ML reply is larger than {limit} bytes")
+    return body
+
+
+def iter_json(value) -> Iterator[str]:
+    """
+    JSON encoding of a payload in pieces. Iterators, such as a queryset's
+    .iterator(), are encoded as arrays while they are consumed, so they are
+    never held in memory as a whole.
+    """
+    if isinstance(value, dict):
+        yield "{"
+        for i, (key, item) in enumerate(value.items()):
+            yield f"{',' if i else ''}{json.dumps(str(key))}:"
+            yield from iter_json(item)
+        yield "}"
+    elif isinstance(value, (list, tuple, Iterator)):
+        yield "["
+        for i, item in enumerate(value):
+            if i:
+                yield ","
+            yield from iter_json(item)
+        yield "]"
+    else:
+        yield json.dumps(value)
+
+
+def iter_body(data, chunk_size=64 * 1024) -> Iterator[bytes]:
+    """Request body of iter_json in chunks of about chunk_size bytes."""
+    buffer, size = [], 0
+    for piece in iter_json(data):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def has_iterator(value) -> bool:
+    if isinstance(value, Iterator):
+        return True
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return False
+    return any(has_iterator(item) for item in value)
+
+
+def post_json(endpoint: str, path: str, data: dict):
+    """
+    POST to the ML service through the pooled session and decode the JSON
+    reply, raises MLError on failure. Payloads holding iterators are encoded
+    while they are sent (chunked transfer encoding), the rest as a plain body
+    with a Content-Length.
+    """
+    if has_iterator(data):
+        body = {
+            "data": iter_body(data),
+            "headers": {"Content-Type": "application/json"},
+        }
+    else:
+        body = {"json": data}
+    start = time.monotonic()
+    failed = True
+    try:
+        with get_session().post(
+            settings.ML_HOST + path,
+            **body,
+            timeout=(settings.ML_CONNECT_TIMEOUT, settings.ML_READ_TIMEOUT),
+            stream=True,
+        ) as r:
+            body = read_reply(r)
+        if r.status_code != 200:
+            raise MLError(f"Failed to send data to ML: {body[:1000]!r}")
+        try:
+            reply = json.loads(body)
+        except ValueError as e:
+            raise MLError(f"ML reply is not JSON: {e}") from e
+        failed = False
+        return reply
+    except requests.RequestException as e:
+        raise MLError(f"Failed to send data to ML: {e}") from e
+    finally:
+        _record_latency(endpoint, time.monotonic() - start, failed)
+
+
+def _invalid(endpoint: str, reply):
+    return MLError(f"Unexpected {endpoint} reply: {str(reply)[:1000]}")
+
+
+def _is_text_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _is_message_list(value) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) > 0
+        and all(
+            isinstance(message, dict) and isinstance(message.get("text"), str)
+            for message in value
+        )
+    )
+
+
+# Python str repr escapes and quotes, translated to their JSON spelling
+REPR_ESCAPES = re.compile(r'\\(x[0-9a-fA-F]{2}|.)|"', re.DOTALL)
+
+
+def _repr_escape_to_json(m: re.Match) -> str:
+    escape = m.group(1)
+    if escape is None:
+        return '\\"'
+    if escape == "'":
+        return escape
+    if len(escape) == 3:
+        return f"\\u00{escape[1:]}"
+    return m.group(0)
+
+
+def decode_text(text: str) -> str:
+    """
+    Text the ML service sends as a quoted string literal, JSON or Python repr
+    ("..." or '...'); anything else is returned as is.
+    """
+    text = text.strip()
+    if len(text) < 2 or text[0] != text[-1] or text[0] not in "\"'":
+        return text
+    body = REPR_ESCAPES.sub(_repr_escape_to_json, text[1:-1])
+    try:
+        return json.loads(f'"{body}"', strict=False)
+    except ValueError as e:
+        raise MLError(f"Cannot decode ML text: {text[:1000]}") from e
+
+
+def _conversation_reply(endpoint: str, reply) -> dict:
+    if (
+        not isinstance(reply, dict)
+        or not _is_message_list(reply.get("messages"))
+        or not _is_text_list(reply.setdefault("places", []))
+    ):
+        raise _invalid(endpoint, reply)
+    return reply
+
+
+def conversation(data: dict) -> dict:
+    """{"messages": [{"text": ...}, ...], "places": [name, ...]}"""
+    return _conversation_reply(
+        CONVERSATION, post_json(CONVERSATION, "/conversation", data)
+    )
+
+
+def conversation_batch(items: list[dict]) -> list[dict]:
+    """
+    Conversation replies of several submissions, in the order of the items.
+    With ML_BATCH_CONVERSATION they are sent in one /conversation/batch call
+    ({"items": [...]} -> {"results": [...]}), otherwise one by one.
+    """
+    if not settings.ML_BATCH_CONVERSATION:
+        return [conversation(data) for data in items]
+    reply = post_json(CONVERSATION_BATCH, "/conversation/batch", {"items": items})
+    results = reply.get("results") if isinstance(reply, dict) else None
+    if not isinstance(results, list) or len(results) != len(items):
+        raise _invalid(CONVERSATION_BATCH, reply)
+    return [_conversation_reply(CONVERSATION_BATCH, result) for result in results]
+
+
+def advice_and_support(data: dict) -> dict:
+    """{"advice": text, "support": text}, texts are decoded from their literals."""
+    reply = post_json(ADVICE_AND_SUPPORT, "/places/advice_and_support", data)
+    if not isinstance(reply, dict) or not all(
+        isinstance(reply.get(key), str) for key in ["advice", "support"]
+    ):
+        raise _invalid(ADVICE_AND_SUPPORT, reply)
+    return {key: decode_text(reply[key]) for key in ["advice", "support"]}
+
+
+def generate_name(data: dict) -> str:
+    reply = post_json(GENERATE_NAME, "/generate_name", data)
+    if not isinstance(reply, str):
+        raise _invalid(GENERATE_NAME, reply)
+    # the name is sometimes quoted twice, with escaped newlines left over
+    return " ".join(decode_text(reply).replace("\\n", " ").split())
+
+
+def iter_stream_chunks(lines: Iterable[str]) -> Iterator[str]:
+    """Text chunks of a server-sent events reply: `data: {"text": ...}` lines up to `data: [DONE]`."""
+    size = 0
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line.removeprefix("data:").strip()
+        if payload == "[DONE]":
+            return
+        size += len(payload)
+        if size > settings.ML_MAX_REPLY_SIZE:
+            raise MLError(f"ML reply is larger than {settings.ML_MAX_REPLY_SIZE} bytes")
+        try:
+            chunk = json.loads(payload)
+        except ValueError as e:
+            raise MLError(f"ML reply is not JSON: {e}") from e
+        chunk = chunk.get("text") if isinstance(chunk, dict) else None
+        if isinstance(chunk, str) and chunk:
+            yield chunk
+
+
+def stream(endpoint: str, path: str, data: dict) -> Iterator[str]:
+    """
+    Yields reply text as the ML service produces it. Replies that are not
+    streamed (plain JSON with "messages") come out as a single chunk.
+    """
+    start = time.monotonic()
+    failed = True
+    try:
+        with get_session().post(
+            settings.ML_HOST + path,
+            json={**data, "stream": True},
+            headers={"Accept": "text/event-stream, application/json"},
+            timeout=(settings.ML_CONNECT_TIMEOUT, settings.ML_READ_TIMEOUT),
+            stream=True,
+        ) as r:
+            if r.status_code != 200:
+                raise MLError(f"Failed to send data to ML: {read_reply(r)[:1000]!r}")
+            if r.headers.get("Content-Type", "").startswith("text/event-stream"):
+                yield from iter_stream_chunks(r.iter_lines(decode_unicode=True))
+            else:
+                try:
+                    reply = json.loads(read_reply(r))
+                except ValueError as e:
+                    raise MLError(f"ML reply is not JSON: {e}") from e
+                if not isinstance(reply, dict) or not _is_message_list(
+                    reply.get("messages")
+                ):
+                    raise _invalid(endpoint, reply)
+                yield reply["messages"][-1]["text"]
+        failed = False
+    except requests.RequestException as e:
+        raise MLError(f"Failed to send data to ML: {e}") from e
+    finally:
+        _record_latency(endpoint, time.monotonic() - start, failed)
@@ -1,6 +1,8 @@
 import uuid
 
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.utils.translation import gettext_lazy as _
 
@@ -109,6 +111,11 @@ class Technopark(models.Model):
     coords_lon = models.DecimalField(
         max_digits=9, decimal_places=6, verbose_name=_("Координаты: долгота"), null=True
     )
+    source_hash = models.CharField(
+        max_length=40, null=True, editable=False, verbose_name=_("Хеш строки импорта")
+    )
+    # catalog.SEARCH_FIELDS, kept up to date by the import and post_save
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -116,6 +123,22 @@ def __str__(self):
     class Meta:
         verbose_name = _("Технопарк")
         verbose_name_plural = _("Технопарки")
+        indexes = [
+            GinIndex(fields=["list_of_activities"], name="technopark_activities_gin"),
+            GinIndex(fields=["infrastructure"], name="technopark_infra_gin"),
+            models.Index(fields=["region"], name="technopark_region_idx"),
+            models.Index(
+                fields=["tax_income", "tax_estate", "tax_ground"],
+                name="technopark_taxes_idx",
+            ),
+            models.Index(
+                fields=["minimal_cost_of_buy"], name="technopark_cost_of_buy_idx"
+            ),
+            models.Index(
+                fields=["coords_lat", "coords_lon"], name="technopark_coords_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="technopark_search_gin"),
+        ]
 
 
 class TechnoparkSubmission(models.Model):
@@ -290,6 +313,24 @@ class TechnoparkSubmission(models.Model):
         verbose_name=_("Дополнительные предпочтения"), null=True, blank=True
     )
 
+    search_query = models.CharField(
+        max_length=500,
+        verbose_name=_("Поиск по описанию объекта"),
+        null=True,
+        blank=True,
+    )
+
+    # Search around a point (near_lat, near_lon, radius_km)
+    near_lat = models.FloatField(
+        verbose_name=_("Широта точки поиска"), null=True, blank=True
+    )
+    near_lon = models.FloatField(
+        verbose_name=_("Долгота точки поиска"), null=True, blank=True
+    )
+    radius_km = models.FloatField(
+        verbose_name=_("Радиус поиска, км"), null=True, blank=True
+    )
+
     ml_data = models.JSONField(verbose_name=_("Данные от ML"), null=True)
 
     def __str__(self):
@@ -709,6 +750,11 @@ class BuildingModel(models.Model):
     coordinates_lon = models.DecimalField(
         max_digits=9, decimal_places=6, verbose_name=_("Координаты: долгота"), null=True
     )
+    source_hash = models.CharField(
+        max_length=40, null=True, editable=False, verbose_name=_("Хеш строки импорта")
+    )
+    # catalog.SEARCH_FIELDS, kept up to date by the import and post_save
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -716,6 +762,20 @@ def __str__(self):
     class Meta:
         verbose_name = _("Объект недвижимости")
         verbose_name_plural = _("Объекты недвижимости")
+        indexes = [
+            GinIndex(fields=["site_format"], name="building_site_format_gin"),
+            GinIndex(fields=["site_type"], name="building_site_type_gin"),
+            GinIndex(fields=["transaction_form"], name="building_transaction_gin"),
+            models.Index(
+                fields=["region", "cost_object"], name="building_region_cost_idx"
+            ),
+            models.Index(fields=["cost_object"], name="building_cost_idx"),
+            models.Index(
+                fields=["coordinates_lat", "coordinates_lon"],
+                name="building_coordinates_idx",
+            ),
+            GinIndex(fields=["search_vector"], name="building_search_gin"),
+        ]
 
 
 class BuildingSubmission(models.Model):
@@ -970,6 +1030,24 @@ class BuildingSubmission(models.Model):
         verbose_name=_("Дополнительные комментарии"), null=True, blank=True
     )
 
+    search_query = models.CharField(
+        max_length=500,
+        verbose_name=_("Поиск по описанию объекта"),
+        null=True,
+        blank=True,
+    )
+
+    # Search around a point (near_lat, near_lon, radius_km)
+    near_lat = models.FloatField(
+        verbose_name=_("Широта точки поиска"), null=True, blank=True
+    )
+    near_lon = models.FloatField(
+        verbose_name=_("Долгота точки поиска"), null=True, blank=True
+    )
+    radius_km = models.FloatField(
+        verbose_name=_("Радиус поиска, км"), null=True, blank=True
+    )
+
     ml_data = models.JSONField(verbose_name=_("Данные от ML"), null=True)
 
     def __str__(self):
@@ -1015,5 +1093,25 @@ class ChatMessage(models.Model):
         upload_to="chat_files", verbose_name=_("Файл"), null=True, blank=True
     )
     data = models.JSONField(verbose_name=_("Данные"), null=True, blank=True)
+    # Places recommended in the message, rows are rendered from the catalog on read
+    place_type = models.CharField(
+        choices=[
+            ("technopark", _("Технопарк")),
+            ("building", _("Объект недвижимости")),
+        ],
+        max_length=20,
+        null=True,
+        blank=True,
+    )
+    place_ids = ArrayField(
+        models.BigIntegerField(), verbose_name=_("Объекты"), null=True, blank=True
+    )
     text = models.TextField(verbose_name=_("Текст сообщения"))
     created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["chat", "created", "id"], name="chat_message_created_idx"
+            ),
+        ]
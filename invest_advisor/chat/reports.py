@@ -0,0 +1,120 @@
+"""
+PDF rendering of place reports. wkhtmltopdf is the default renderer,
+REPORT_RENDERER = "xhtml2pdf" renders in-process without starting a
+wkhtmltopdf process per report (needs the "reports" extra).
+"""
+import hashlib
+import io
+import json
+from functools import lru_cache
+
+import markdown
+import pdfkit
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+REPORT_TEMPLATE = """
+<html>
+<head>
+<meta charset="UTF-8">
+{style}
+</head>
+<body>
+<h2>Меры поддержки</h2>
+{support_html}
+<h2>Советы по найму</h2>
+{advice_html}
+</body>
+</html>
+"""
+
+PDFKIT_OPTIONS = {
+    "page-size": "A4",
+    "margin-top": "0.75in",
+    "margin-right": "0.75in",
+    "margin-bottom": "0.75in",
+    "margin-left": "0.75in",
+    "encoding": "UTF-8",
+    "custom-header": [("Accept-Encoding", "gzip")],
+    "cookie": [],
+    "no-outline": None,
+}
+
+# xhtml2pdf only knows the base14 fonts, which have no cyrillic glyphs
+XHTML2PDF_STYLE = """
+<style>
+@page {{ size: a4; margin: 0.75in; }}
+@font-face {{ font-family: "Report"; src: url("{font_path}"); }}
+body {{ font-family: "Report"; }}
+</style>
+"""
+
+
+class ReportError(Exception):
+    pass
+
+
+def render_report_html(support_text: str, advice_text: str, style: str = "") -> str:
+    return REPORT_TEMPLATE.format(
+        style=style,
+        support_html=markdown.markdown(support_text, output_format="html"),
+        advice_html=markdown.markdown(advice_text, output_format="html"),
+    )
+
+
+@lru_cache
+def _pdfkit_configuration():
+    # looks wkhtmltopdf up with `which` once per process instead of per report
+    return pdfkit.configuration()
+
+
+def render_wkhtmltopdf(support_text: str, advice_text: str) -> bytes:
+    html = render_report_html(support_text, advice_text)
+    # output_path=False returns the PDF from wkhtmltopdf's stdout
+    return pdfkit.from_string(
+        html, False, options=PDFKIT_OPTIONS, configuration=_pdfkit_configuration()
+    )
+
+
+def render_xhtml2pdf(support_text: str, advice_text: str) -> bytes:
+    try:
+        from xhtml2pdf import pisa
+    except ImportError as e:
+        raise ImproperlyConfigured(
+            "REPORT_RENDERER 'xhtml2pdf' needs the xhtml2pdf package"
+        ) from e
+    style = XHTML2PDF_STYLE.format(font_path=settings.REPORT_FONT_PATH)
+    html = render_report_html(support_text, advice_text, style)
+    output = io.BytesIO()
+    result = pisa.CreatePDF(html, dest=output, encoding="utf-8")
+    if result.err:
+        raise ReportError(f"Failed to render report: {result.log}")
+    return output.getvalue()
+
+
+def report_file_name(support_text: str, advice_text: str) -> str:
+    """
+    Content-addressed storage name: the same texts rendered with the same
+    renderer and options always map to the same file.
+    """
+    options = {
+        "renderer": settings.REPORT_RENDERER,
+        "pdfkit": PDFKIT_OPTIONS,
+        "font": settings.REPORT_FONT_PATH,
+    }
+    digest = hashlib.sha256(
+        json.dumps(
+            [support_text, advice_text, REPORT_TEMPLATE, options], sort_keys=True
+        ).encode()
+    ).hexdigest()
+    return f"chat_files/reports/{digest}.pdf"
+
+
+RENDERERS = {
+    "wkhtmltopdf": render_wkhtmltopdf,
+    "xhtml2pdf": render_xhtml2pdf,
+}
+
+
+def render_pdf(support_text: str, advice_text: str) -> bytes:
+    return RENDERERS[settings.REPORT_RENDERER](support_text, advice_text)
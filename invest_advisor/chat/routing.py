@@ -0,0 +1,7 @@
+from django.urls import path
+
+from invest_advisor.chat.consumers import ChatConsumer
+
+websocket_urlpatterns = [
+    path("ws/chat/<str:id>/", ChatConsumer.as_asgi()),
+]
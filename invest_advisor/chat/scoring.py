@@ -0,0 +1,164 @@
+"""
+Ranked matching of the catalog against a submission.
+
+The hard filters drop a site that misses any single answer, so an
+over-constrained submission matches nothing and a broad one matches
+everything. The scoring index scores every site of the catalog snapshot in
+one pass: each answered filter is a criterion with a penalty from 0 (met) to
+1 (far off), the score is one minus the weighted mean penalty. Sites that
+pass every hard filter score 1.
+"""
+import numpy as np
+
+from invest_advisor.chat.filters import Contains, Near, Overlap, Range, Search
+from invest_advisor.chat.services import PLACE_FILTERS
+from invest_advisor.chat.snapshot import CatalogSnapshot, get_catalog_snapshot
+
+
+class ScoringIndex:
+    """
+    Ranks the rows of a catalog snapshot. Numeric columns are scaled to
+    [0, 1] by the catalog minimum and maximum of the column, so range
+    penalties are comparable across units. Missing values are NaN and always
+    get the full penalty.
+    """
+
+    def __init__(self, spec, snapshot: CatalogSnapshot):
+        self.spec = spec
+        self.snapshot = snapshot
+        self.size = snapshot.size
+        self.pks = snapshot.pks
+        self.columns = snapshot.columns
+        raw = snapshot.numeric
+        # fmin/fmax skip NaN, columns without any value keep the identity scale
+        low = np.fmin.reduce(raw, axis=0, initial=np.inf)
+        span = np.fmax.reduce(raw, axis=0, initial=-np.inf) - low
+        self.low = np.where(np.isfinite(low), low, 0.0)
+        self.span = np.where(np.isfinite(span) & (span > 0), span, 1.0)
+
+    def column(self, field) -> np.ndarray:
+        i = self.columns[field]
+        return (self.snapshot.numeric[:, i] - self.low[i]) / self.span[i]
+
+    def scale(self, field, value) -> float:
+        i = self.columns[field]
+        return (float(value) - self.low[i]) / self.span[i]
+
+    def penalty(self, spec_filter, value) -> np.ndarray:
+        """Penalty of every site for one answered filter."""
+        if isinstance(spec_filter, Near):
+            lat, lon, radius = value
+            distance = self.snapshot.distance(spec_filter, lat, lon)
+            penalty = (distance - radius) / radius
+        elif isinstance(spec_filter, Contains):
+            below = self.column(spec_filter.min_field) - self.scale(
+                spec_filter.min_field, value
+            )
+            above = self.scale(spec_filter.max_field, value) - self.column(
+                spec_filter.max_field
+            )
+            penalty = np.maximum(below, 0) + np.maximum(above, 0)
+        elif isinstance(spec_filter, Range):
+            min_value, max_value = value
+            penalty = np.zeros(self.size)
+            if min_value is not None:
+                below = self.scale(spec_filter.min_field, min_value) - self.column(
+                    spec_filter.min_field
+                )
+                penalty = penalty + np.maximum(below, 0)
+            if max_value is not None:
+                above = self.column(spec_filter.max_field) - self.scale(
+                    spec_filter.max_field, max_value
+                )
+                penalty = penalty + np.maximum(above, 0)
+        elif isinstance(spec_filter, Overlap | Search):
+            matched = self.snapshot.test(spec_filter, value)
+            penalty = (~matched).astype(float)
+        else:
+            matched = self.snapshot.equals(spec_filter.field, value)
+            penalty = (~matched).astype(float)
+        return np.nan_to_num(np.clip(penalty, 0, 1), nan=1.0)
+
+    def top(self, scores: np.ndarray, k: int, ties=None) -> np.ndarray:
+        """
+        Rows of the k best scores, best first. Ties go by ``ties``, an order
+        key of every row, and then by primary key.
+        """
+        k = min(k, self.size)
+        if k <= 0:
+            return np.array([], dtype=int)
+        if ties is None:
+            ties = np.zeros(self.size)
+        threshold = np.partition(scores, self.size - k)[self.size - k]
+        candidates = np.flatnonzero(scores >= threshold)
+        order = np.lexsort(
+            (self.pks[candidates], ties[candidates], -scores[candidates])
+        )
+        return candidates[order][:k]
+
+    def rank(
+        self, submission, k: int, weights: dict = None, candidates=None
+    ) -> list[dict]:
+        """
+        The k best sites for a submission with their score and the match
+        (1 - penalty) of every answered criterion. ``weights`` maps filter
+        names to weights, criteria default to 1. ``candidates`` limits the
+        ranking to these primary keys, equal scores keep their order.
+        """
+        weights = weights or {}
+        criteria = []
+        for spec_filter in self.spec:
+            value = spec_filter.value(submission)
+            if value is not None:
+                criteria.append((spec_filter, self.penalty(spec_filter, value)))
+        if criteria:
+            penalties = np.vstack([penalty for _, penalty in criteria])
+            weight = np.array(
+                [weights.get(spec_filter.name, 1.0) for spec_filter, _ in criteria]
+            )
+            scores = 1 - weight @ penalties / weight.sum()
+        else:
+            penalties = np.zeros((0, self.size))
+            scores = np.ones(self.size)
+        ties = None
+        if candidates is not None:
+            # the snapshot is in primary key order
+            candidates = np.asarray(candidates, dtype=np.int64)
+            rows = np.searchsorted(self.pks, candidates)
+            known = rows < self.size
+            known[known] = self.pks[rows[known]] == candidates[known]
+            ties = np.full(self.size, len(candidates))
+            ties[rows[known]] = np.flatnonzero(known)
+            scores = np.where(ties < len(candidates), scores, -np.inf)
+            k = min(k, int(np.isfinite(scores).sum()))
+        return [
+            {
+                "pk": int(self.pks[i]),
+                "name": self.snapshot.value("name", i),
+                "score": round(float(scores[i]), 4),
+                "criteria": {
+                    spec_filter.name: round(float(1 - penalties[j, i]), 4)
+                    for j, (spec_filter, _) in enumerate(criteria)
+                },
+            }
+            for i in self.top(scores, k, ties)
+        ]
+
+
+_indexes = {}
+
+
+def get_scoring_index(place_type: str) -> ScoringIndex:
+    """Per-process index of the current catalog snapshot."""
+    model, spec = PLACE_FILTERS[place_type]
+    snapshot = get_catalog_snapshot(model, spec)
+    index = _indexes.get(place_type)
+    if index is None or index.snapshot is not snapshot:
+        index = _indexes[place_type] = ScoringIndex(spec, snapshot)
+    return index
+
+
+def rank_places(
+    place_type: str, submission, k: int, weights: dict = None, candidates=None
+) -> list:
+    return get_scoring_index(place_type).rank(submission, k, weights, candidates)
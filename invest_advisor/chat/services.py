@@ -1,508 +1,183 @@
-import tempfile
-from ast import literal_eval
+import time
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django_redis import get_redis_connection
+
+from invest_advisor.chat.filters import (
+    BUILDING_FILTERS,
+    TECHNOPARK_FILTERS,
+    Near,
+    order_by_search,
+    question_fields,
+)
+from invest_advisor.chat.models import BuildingModel, Technopark
+from invest_advisor.chat.reports import render_pdf, report_file_name
+from invest_advisor.chat.snapshot import get_catalog_snapshot
 
-import markdown
-import pdfkit
-from django.core.files import File
-from django.db import models
-from django.db.models import Q
 
-from invest_advisor.chat.models import BuildingModel, Technopark
+def chat_group_name(chat_id) -> str:
+    return f"chat_{chat_id}"
+
+
+def send_to_chat(chat_id, event: dict):
+    """Push an event to every socket listening to the chat, used from sync code."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(chat_group_name(chat_id), event)
+
+
+def chat_messages_version(chat_id, create=False) -> str | None:
+    """Opaque token that changes whenever a message of the chat is saved or deleted."""
+    key = f"chat_messages_version:{chat_id}"
+    version = cache.get(key)
+    if version is None and create:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def touch_chat_messages(chat_id):
+    """Change the version of the chat messages and wake up long-polling requests."""
+    cache.set(f"chat_messages_version:{chat_id}", uuid.uuid4().hex, None)
+    get_redis_connection("default").publish(f"chat_messages:{chat_id}", "changed")
+
+
+def wait_for_chat_messages(chat_id, version: str, timeout: float) -> str | None:
+    """
+    Block until the chat messages version differs from ``version`` or the
+    timeout passes, without touching the database. Returns the current version.
+    """
+    pubsub = get_redis_connection("default").pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(f"chat_messages:{chat_id}")
+    try:
+        deadline = time.monotonic() + timeout
+        # subscribed before the check, so a change in between is not missed
+        current = chat_messages_version(chat_id)
+        while current == version and time.monotonic() < deadline:
+            pubsub.get_message(timeout=deadline - time.monotonic())
+            current = chat_messages_version(chat_id)
+        return current
+    finally:
+        pubsub.close()
+
+
+def get_matching_pks(model, spec, submission) -> list:
+    """Primary keys matching the submission, from the catalog snapshot."""
+    snapshot = get_catalog_snapshot(model, spec)
+    return snapshot.pks[snapshot.match(spec, submission)].tolist()
+
+
+def answered(spec, submission) -> bool:
+    return any(spec_filter.value(submission) is not None for spec_filter in spec)
 
 
 def filter_technoparks(submission):
-    technoparks = Technopark.objects.all()
-
-    if submission.region:
-        technoparks = technoparks.filter(region=submission.region)
-
-    if submission.min_num_residents is not None:
-        technoparks = technoparks.filter(
-            num_residents__gte=submission.min_num_residents
-        )
-    if submission.max_num_residents is not None:
-        technoparks = technoparks.filter(
-            num_residents__lte=submission.max_num_residents
-        )
-
-    if submission.min_year_of_object_forming is not None:
-        technoparks = technoparks.filter(
-            year_of_object_forming__gte=submission.min_year_of_object_forming
-        )
-    if submission.max_year_of_object_forming is not None:
-        technoparks = technoparks.filter(
-            year_of_object_forming__lte=submission.max_year_of_object_forming
-        )
-
-    if submission.min_total_square is not None:
-        technoparks = technoparks.filter(total_square__gte=submission.min_total_square)
-    if submission.max_total_square is not None:
-        technoparks = technoparks.filter(total_square__lte=submission.max_total_square)
-
-    if submission.min_minimal_cost_of_buy is not None:
-        technoparks = technoparks.filter(
-            minimal_cost_of_buy__gte=submission.min_minimal_cost_of_buy
-        )
-    if submission.max_minimal_cost_of_buy is not None:
-        technoparks = technoparks.filter(
-            minimal_cost_of_buy__lte=submission.max_minimal_cost_of_buy
-        )
-
-    if submission.list_of_activities:
-        technoparks = technoparks.filter(
-            list_of_activities__overlap=submission.list_of_activities
-        )
-
-    if submission.infrastructure:
-        technoparks = technoparks.filter(
-            infrastructure__overlap=submission.infrastructure
-        )
-
-    if submission.min_tax_income is not None:
-        technoparks = technoparks.filter(tax_income__gte=submission.min_tax_income)
-    if submission.max_tax_income is not None:
-        technoparks = technoparks.filter(tax_income__lte=submission.max_tax_income)
-
-    if submission.min_tax_estate is not None:
-        technoparks = technoparks.filter(tax_estate__gte=submission.min_tax_estate)
-    if submission.max_tax_estate is not None:
-        technoparks = technoparks.filter(tax_estate__lte=submission.max_tax_estate)
-
-    if submission.min_tax_ground is not None:
-        technoparks = technoparks.filter(tax_ground__gte=submission.min_tax_ground)
-    if submission.max_tax_ground is not None:
-        technoparks = technoparks.filter(tax_ground__lte=submission.max_tax_ground)
-
-    if submission.min_tax_transport is not None:
-        technoparks = technoparks.filter(
-            tax_transport__gte=submission.min_tax_transport
-        )
-    if submission.max_tax_transport is not None:
-        technoparks = technoparks.filter(
-            tax_transport__lte=submission.max_tax_transport
-        )
-
-    if submission.min_insurance_premiums is not None:
-        technoparks = technoparks.filter(
-            insurance_premiums__gte=submission.min_insurance_premiums
-        )
-    if submission.max_insurance_premiums is not None:
-        technoparks = technoparks.filter(
-            insurance_premiums__lte=submission.max_insurance_premiums
-        )
-
-    if submission.free_custom_zone is not None:
-        technoparks = technoparks.filter(free_custom_zone=submission.free_custom_zone)
-
-    if submission.min_minimal_investment_volume is not None:
-        technoparks = technoparks.filter(
-            minimal_investment_volume__gte=submission.min_minimal_investment_volume
-        )
-    if submission.max_minimal_investment_volume is not None:
-        technoparks = technoparks.filter(
-            minimal_investment_volume__lte=submission.max_minimal_investment_volume
-        )
-
-    return technoparks
-
-
-def get_options_for_technopark_question(question_number, technoparks):
-    question_field_mapping = {
-        1: {"field": "region", "type": "string"},
-        2: {"field": ["num_residents"], "type": "range"},
-        3: {"field": ["year_of_object_forming"], "type": "range"},
-        4: {"field": ["total_square"], "type": "range"},
-        5: {"field": ["minimal_cost_of_buy"], "type": "range"},
-        6: {"field": "list_of_activities", "type": "array"},
-        7: {"field": "infrastructure", "type": "array"},
-        8: {"field": ["tax_income"], "type": "range"},
-        9: {"field": ["tax_estate"], "type": "range"},
-        10: {"field": ["tax_ground"], "type": "range"},
-        11: {"field": ["tax_transport"], "type": "range"},
-        12: {"field": ["insurance_premiums"], "type": "range"},
-        13: {"field": "free_custom_zone", "type": "boolean"},
-        14: {"field": ["minimal_investment_volume"], "type": "range"},
-    }
-    if question_number > 14:
+    if not answered(TECHNOPARK_FILTERS, submission):
+        return Technopark.objects.all()
+    technoparks = Technopark.objects.filter(
+        pk__in=get_matching_pks(Technopark, TECHNOPARK_FILTERS, submission)
+    )
+    return order_by_search(technoparks, TECHNOPARK_FILTERS, submission)
+
+
+TECHNOPARK_QUESTION_FIELDS = question_fields(TECHNOPARK_FILTERS, None)
+
+
+def get_options_from_technopark_facets(question_number, facets):
+    if question_number not in TECHNOPARK_QUESTION_FIELDS:
         return None, None
-    field_info = question_field_mapping[question_number]
+    field_info = TECHNOPARK_QUESTION_FIELDS[question_number]
     fields = field_info["field"]
-    field_type = field_info["type"]
-    next_question = question_number + 1 if technoparks.count() != 0 else None
+    next_question = question_number + 1 if facets["count"] != 0 else None
 
-    if field_type == "range":
-        min_field, max_field = fields[0], fields[0]
-        min_value = technoparks.exclude(**{f"{min_field}__isnull": True}).aggregate(
-            models.Min(min_field)
-        )[f"{min_field}__min"]
-        max_value = technoparks.exclude(**{f"{max_field}__isnull": True}).aggregate(
-            models.Max(max_field)
-        )[f"{max_field}__max"]
-        return (min_value, max_value), next_question
-
-    if field_type == "array":
-        options = (
-            technoparks.values_list(fields, flat=True)
-            .distinct()
-            .exclude(**{f"{fields}__isnull": True})
-        )
-        unique_options = set()
-        for option in options:
-            unique_options.update(option)
-        return list(unique_options), next_question
-
-    if field_type == "boolean":
-        return (
-            technoparks.values_list(fields, flat=True)
-            .distinct()
-            .exclude(**{f"{fields}__isnull": True}),
-            next_question,
-        )
-
-    return (
-        technoparks.values_list(fields, flat=True)
-        .distinct()
-        .exclude(**{f"{fields}__isnull": True}),
-        next_question,
-    )
+    if field_info["type"] == "range":
+        min_field, max_field = fields
+        return (facets["min"][min_field], facets["max"][max_field]), next_question
+
+    return list(facets["values"][fields]), next_question
 
 
 def filter_buildings(submission):
-    buildings = BuildingModel.objects.all()
-
-    if submission.pref_treatment is not None:
-        buildings = buildings.filter(pref_treatment=submission.pref_treatment)
-
-    if submission.region:
-        buildings = buildings.filter(region=submission.region)
-
-    if submission.site_format:
-        buildings = buildings.filter(site_format__overlap=submission.site_format)
-
-    if submission.site_type:
-        buildings = buildings.filter(site_type__overlap=submission.site_type)
-
-    if submission.transaction_form:
-        buildings = buildings.filter(
-            transaction_form__overlap=submission.transaction_form
-        )
-
-    if submission.min_cost_object is not None:
-        buildings = buildings.filter(cost_object__gte=submission.min_cost_object)
-    if submission.max_cost_object is not None:
-        buildings = buildings.filter(cost_object__lte=submission.max_cost_object)
-
-    if submission.water_supply_available is not None:
-        buildings = buildings.filter(
-            water_supply_available=submission.water_supply_available
-        )
-    if submission.water_supply_available:
-        if (
-            submission.min_water_supply_rate_consumption is not None
-            and submission.max_water_supply_rate_consumption is not None
-        ):
-            buildings = buildings.filter(
-                Q(
-                    water_supply_rate_consumption_min__gte=submission.min_water_supply_rate_consumption
-                )
-                & Q(
-                    water_supply_rate_consumption_max__lte=submission.max_water_supply_rate_consumption
-                )
-            )
-        if (
-            submission.min_water_supply_objects_max_capacity is not None
-            and submission.max_water_supply_objects_max_capacity is not None
-        ):
-            buildings = buildings.filter(
-                Q(
-                    water_supply_objects_max_capacity__gte=submission.min_water_supply_objects_max_capacity
-                )
-                & Q(
-                    water_supply_objects_max_capacity__lte=submission.max_water_supply_objects_max_capacity
-                )
-            )
-
-    if submission.gas_supply_available is not None:
-        buildings = buildings.filter(
-            gas_supply_available=submission.gas_supply_available
-        )
-    if submission.gas_supply_available:
-        if submission.gas_supply_rate_consumption is not None:
-            buildings = buildings.filter(
-                Q(
-                    gas_supply_rate_consumption_min__lte=submission.gas_supply_rate_consumption
-                )
-                & Q(
-                    gas_supply_rate_consumption_max__gte=submission.gas_supply_rate_consumption
-                )
-            )
-        if (
-            submission.min_gas_supply_rate_transport is not None
-            and submission.max_gas_supply_rate_transport is not None
-        ):
-            buildings = buildings.filter(
-                Q(
-                    gas_supply_rate_transport__gte=submission.min_gas_supply_rate_transport
-                )
-                & Q(
-                    gas_supply_rate_transport__lte=submission.max_gas_supply_rate_transport
-                )
-            )
-
-    if submission.electricity_supply_available is not None:
-        buildings = buildings.filter(
-            electricity_supply_available=submission.electricity_supply_available
-        )
-    if submission.electricity_supply_available:
-        if (
-            submission.min_electricity_rate_consumption is not None
-            and submission.max_electricity_rate_consumption is not None
-        ):
-            buildings = buildings.filter(
-                Q(
-                    electricity_rate_consumption_min__gte=submission.min_electricity_rate_consumption
-                )
-                & Q(
-                    electricity_rate_consumption_max__lte=submission.max_electricity_rate_consumption
-                )
-            )
-        if (
-            submission.min_electricity_rate_transport is not None
-            and submission.max_electricity_rate_transport is not None
-        ):
-            buildings = buildings.filter(
-                Q(
-                    electricity_rate_transport__gte=submission.min_electricity_rate_transport
-                )
-                & Q(
-                    electricity_rate_transport__lte=submission.max_electricity_rate_transport
-                )
-            )
-
-    if submission.heating_available is not None:
-        buildings = buildings.filter(heating_available=submission.heating_available)
-    if submission.heating_available:
-        if (
-            submission.min_heating_rate_consumption is not None
-            and submission.max_heating_rate_consumption is not None
-        ):
-            buildings = buildings.filter(
-                Q(heating_rate_consumption__gte=submission.min_heating_rate_consumption)
-                & Q(
-                    heating_rate_consumption__lte=submission.max_heating_rate_consumption
-                )
-            )
-        if (
-            submission.min_heating_rate_transport is not None
-            and submission.max_heating_rate_transport is not None
-        ):
-            buildings = buildings.filter(
-                Q(heating_rate_transport__gte=submission.min_heating_rate_transport)
-                & Q(heating_rate_transport__lte=submission.max_heating_rate_transport)
-            )
-
-    if submission.waste_disposal_available is not None:
-        buildings = buildings.filter(
-            waste_disposal_available=submission.waste_disposal_available
-        )
-
-    if submission.access_roads_available is not None:
-        buildings = buildings.filter(
-            access_roads_available=submission.access_roads_available
-        )
-    if submission.railways_available is not None:
-        buildings = buildings.filter(railways_available=submission.railways_available)
-    if submission.truck_parking_available is not None:
-        buildings = buildings.filter(
-            truck_parking_available=submission.truck_parking_available
-        )
-
-    return buildings
-
-
-def get_options_for_building_question(question_number, buildings, submission):
-    question_field_mapping = {
-        1: {"field": "pref_treatment", "type": "boolean", "next": 2},
-        2: {"field": "region", "type": "string", "next": 3},
-        3: {"field": "site_format", "type": "array", "next": 4},
-        4: {"field": "site_type", "type": "array", "next": 5},
-        5: {"field": "transaction_form", "type": "array", "next": 6},
-        6: {"field": "cost_object", "type": "range", "next": 7},
-        7: {
-            "field": "water_supply_available",
-            "type": "boolean",
-            "next": 8 if getattr(submission, "water_supply_available", None) else 10,
-        },
-        8: {
-            "field": [
-                "water_supply_rate_consumption_min",
-                "water_supply_rate_consumption_max",
-            ],
-            "type": "range",
-            "next": 9,
-        },
-        9: {
-            "field": "water_supply_objects_max_capacity",
-            "type": "range",
-            "next": 10,
-        },
-        10: {
-            "field": "gas_supply_available",
-            "type": "boolean",
-            "next": 11 if getattr(submission, "gas_supply_available", None) else 13,
-        },
-        11: {
-            "field": [
-                "gas_supply_rate_consumption_min",
-                "gas_supply_rate_consumption_max",
-            ],
-            "type": "range",
-            "next": 12,
-        },
-        12: {
-            "field": "gas_supply_rate_transport",
-            "type": "range",
-            "next": 13,
-        },
-        13: {
-            "field": "electricity_supply_available",
-            "type": "boolean",
-            "next": (
-                14 if getattr(submission, "electricity_supply_available", None) else 16
-            ),
-        },
-        14: {
-            "field": [
-                "electricity_rate_consumption_min",
-                "electricity_rate_consumption_max",
-            ],
-            "type": "range",
-            "next": 15,
-        },
-        15: {
-            "field": "electricity_rate_transport",
-            "type": "range",
-            "next": 16,
-        },
-        16: {
-            "field": "heating_available",
-            "type": "boolean",
-            "next": 17 if getattr(submission, "heating_available", None) else 19,
-        },
-        17: {
-            "field": "heating_rate_consumption",
-            "type": "range",
-            "next": 18,
-        },
-        18: {
-            "field": "heating_rate_transport",
-            "type": "range",
-            "next": 19,
-        },
-        19: {
-            "field": "waste_disposal_available",
-            "type": "boolean",
-            "next": 20,
-        },
-        20: {"field": "access_roads_available", "type": "boolean", "next": 21},
-        21: {"field": "railways_available", "type": "boolean", "next": 22},
-        22: {"field": "truck_parking_available", "type": "boolean", "next": 23},
-    }
+    if not answered(BUILDING_FILTERS, submission):
+        return BuildingModel.objects.all()
+    buildings = BuildingModel.objects.filter(
+        pk__in=get_matching_pks(BuildingModel, BUILDING_FILTERS, submission)
+    )
+    return order_by_search(buildings, BUILDING_FILTERS, submission)
+
+
+PLACE_FILTERS = {
+    "technopark": (Technopark, TECHNOPARK_FILTERS),
+    "building": (BuildingModel, BUILDING_FILTERS),
+}
+
+
+def nearest_places(place_type: str, lat, lon, k: int, radius_km=None) -> list:
+    """
+    (pk, distance in km) of the k places closest to a point, optionally only
+    those within radius_km, which also narrows the scan to a bounding box.
+    """
+    model, spec = PLACE_FILTERS[place_type]
+    near = next(spec_filter for spec_filter in spec if isinstance(spec_filter, Near))
+    places = model.objects.filter(
+        **{f"{near.lat_field}__isnull": False, f"{near.lon_field}__isnull": False}
+    )
+    if radius_km:
+        places = places.filter(near.q((lat, lon, radius_km)))
+    return list(
+        places.annotate(distance_km=near.distance(lat, lon))
+        .order_by("distance_km", "pk")
+        .values_list("pk", "distance_km")[:k]
+    )
+
+
+def get_building_question_fields(submission):
+    """Building wizard questions; which one comes next depends on the answers so far."""
+    return question_fields(BUILDING_FILTERS, submission)
+
+
+def facet_fields(questions: dict) -> tuple[list, list, list]:
+    """Range, value and array fields a wizard asks about."""
+    range_fields, value_fields, array_fields = [], [], []
+    for field_info in questions.values():
+        fields = field_info["field"]
+        if field_info["type"] == "range":
+            range_fields += [f for f in dict.fromkeys(fields) if f not in range_fields]
+        elif field_info["type"] == "array":
+            array_fields.append(fields)
+        else:
+            value_fields.append(fields)
+    return range_fields, value_fields, array_fields
+
+
+def get_options_from_building_facets(question_number, facets, submission):
+    question_field_mapping = get_building_question_fields(submission)
     if question_number not in question_field_mapping:
         return None, None
-    buildings_count = buildings.count()
     field_info = question_field_mapping[question_number]
     fields = field_info["field"]
     field_type = field_info["type"]
     next_question = field_info["next"]
-    if buildings_count == 1:
+    if facets["count"] == 1:
         return None, None
 
     if field_type == "range":
-        if isinstance(fields, list):
-            min_field, max_field = fields
-            min_value = buildings.exclude(**{f"{min_field}__isnull": True}).aggregate(
-                models.Min(min_field)
-            )[f"{min_field}__min"]
-            max_value = buildings.exclude(**{f"{max_field}__isnull": True}).aggregate(
-                models.Max(max_field)
-            )[f"{max_field}__max"]
-        else:
-            min_value = buildings.exclude(**{f"{fields}__isnull": True}).aggregate(
-                models.Min(fields)
-            )[f"{fields}__min"]
-            max_value = buildings.exclude(**{f"{fields}__isnull": True}).aggregate(
-                models.Max(fields)
-            )[f"{fields}__max"]
-        return (min_value, max_value), next_question
-
-    if field_type == "array":
-        options = (
-            buildings.values_list(fields, flat=True)
-            .distinct()
-            .exclude(**{f"{fields}__isnull": True})
-        )
-        unique_options = set()
-        for option in options:
-            unique_options.update(option)
-        return list(unique_options), next_question
-
-    if field_type == "boolean":
-        return (
-            buildings.values_list(fields, flat=True)
-            .distinct()
-            .exclude(**{f"{fields}__isnull": True}),
-            next_question,
-        )
-
-    return (
-        buildings.values_list(fields, flat=True)
-        .distinct()
-        .exclude(**{f"{fields}__isnull": True}),
-        next_question,
-    )
-
+        min_field, max_field = fields
+        return (facets["min"][min_field], facets["max"][max_field]), next_question
 
-def clean_and_process_text(text):
-    return literal_eval(text)
+    return list(facets["values"][fields]), next_question
 
 
 def generate_report_file(chat_message, support_text, advice_text):
-    support_text = clean_and_process_text(support_text)
-    advice_text = clean_and_process_text(advice_text)
-
-    support_html = markdown.markdown(support_text, output_format="html")
-    advice_html = markdown.markdown(advice_text, output_format="html")
-
-    html_content = f"""
-<html>
-<head>
-<meta charset="UTF-8">
-</head>
-<body>
-<h2>Меры поддержки</h2>
-{support_html}
-<h2>Советы по найму</h2>
-{advice_html}
-</body>
-</html>
-"""
-
-    options = {
-        "page-size": "A4",
-        "margin-top": "0.75in",
-        "margin-right": "0.75in",
-        "margin-bottom": "0.75in",
-        "margin-left": "0.75in",
-        "encoding": "UTF-8",
-        "custom-header": [("Accept-Encoding", "gzip")],
-        "cookie": [],
-        "no-outline": None,
-    }
-
-    with tempfile.NamedTemporaryFile(delete=True, suffix=".pdf") as output:
-        pdfkit.from_string(html_content, output.name, options=options)
-        with open(output.name, "rb") as f:
-            chat_message.file.save(f"{chat_message.chat.id}_report.pdf", File(f))
-        chat_message.save()
+    name = report_file_name(support_text, advice_text)
+    storage = chat_message.file.storage
+    if not storage.exists(name):
+        name = storage.save(name, ContentFile(render_pdf(support_text, advice_text)))
+    chat_message.file.name = name
+    chat_message.save()
     return chat_message.file.path
@@ -1,7 +1,18 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from invest_advisor.chat.models import BuildingSubmission, Chat, TechnoparkSubmission
+from invest_advisor.chat.api.serializers import ListChatMessagesSerializer
+from invest_advisor.chat.catalog import bump_catalog_version, update_search_vectors
+from invest_advisor.chat.models import (
+    BuildingModel,
+    BuildingSubmission,
+    Chat,
+    ChatMessage,
+    Technopark,
+    TechnoparkSubmission,
+)
+from invest_advisor.chat.services import send_to_chat, touch_chat_messages
 
 
 @receiver(post_save, sender=TechnoparkSubmission)
@@ -14,3 +25,32 @@ def create_chat_submission(sender, instance, created, **kwargs):
             name=instance.name,
             user=instance.user,
         )
+
+
+@receiver(post_save, sender=ChatMessage)
+def push_chat_message(sender, instance, **kwargs):
+    event = {
+        "type": "chat.message",
+        "message": ListChatMessagesSerializer(instance).data,
+    }
+    transaction.on_commit(lambda: send_to_chat(instance.chat_id, event))
+    transaction.on_commit(lambda: touch_chat_messages(instance.chat_id))
+
+
+@receiver(post_delete, sender=ChatMessage)
+def touch_deleted_chat_message(sender, instance, **kwargs):
+    transaction.on_commit(lambda: touch_chat_messages(instance.chat_id))
+
+
+@receiver(post_save, sender=Technopark)
+@receiver(post_delete, sender=Technopark)
+@receiver(post_save, sender=BuildingModel)
+@receiver(post_delete, sender=BuildingModel)
+def catalog_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_catalog_version(sender))
+
+
+@receiver(post_save, sender=Technopark)
+@receiver(post_save, sender=BuildingModel)
+def update_search_vector(sender, instance, **kwargs):
+    update_search_vectors(sender, [instance.pk])
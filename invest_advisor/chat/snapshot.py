@@ -0,0 +1,344 @@
+"""
+Columnar snapshot of a catalog version.
+
+The filter columns of every site are read from the database once per catalog
+version: numbers as one float matrix (NaN for missing values), other values
+and array items dictionary-encoded as integer codes. The first process that
+needs a version writes it to CATALOG_SNAPSHOT_DIR, every web and Celery
+worker then maps the same files read-only, so the page cache holds a single
+copy. Without CATALOG_SNAPSHOT_DIR the arrays stay in process memory.
+
+Filtering, facets and ranking run on the arrays and never query the catalog
+tables between imports.
+"""
+import json
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import models
+
+from invest_advisor.chat.catalog import get_catalog_version
+from invest_advisor.chat.filters import (
+    EARTH_RADIUS_KM,
+    Contains,
+    Exact,
+    Near,
+    Overlap,
+    Range,
+    Search,
+)
+
+
+def haversine_km_array(lat, lon, lats, lons) -> np.ndarray:
+    """filters.haversine_km from a point to arrays of coordinates."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(a), 1))
+
+
+def spec_columns(spec) -> tuple[list, list, list]:
+    """Numeric, value and array fields of a filter spec."""
+    numeric, values, arrays = [], ["name"], []
+    for spec_filter in spec:
+        if isinstance(spec_filter, Range | Near):
+            numeric += spec_filter.model_fields
+        elif isinstance(spec_filter, Overlap):
+            arrays.append(spec_filter.field)
+        elif isinstance(spec_filter, Exact):
+            values.append(spec_filter.field)
+    return (
+        list(dict.fromkeys(numeric)),
+        list(dict.fromkeys(values)),
+        list(dict.fromkeys(arrays)),
+    )
+
+
+def number_kind(field) -> str:
+    if isinstance(field, models.IntegerField):
+        return "int"
+    if isinstance(field, models.DecimalField):
+        return "decimal"
+    return "float"
+
+
+def encode(values, dictionary: dict) -> list[int]:
+    return [
+        -1 if value is None else dictionary.setdefault(value, len(dictionary))
+        for value in values
+    ]
+
+
+def snapshot_columns(model, spec) -> tuple[dict, dict]:
+    """Meta and arrays of a CatalogSnapshot, from one query."""
+    numeric, values, arrays = spec_columns(spec)
+    rows = list(model.objects.order_by("pk").values("pk", *numeric, *values, *arrays))
+    meta = {
+        "size": len(rows),
+        "numeric": numeric,
+        "kinds": {
+            field: number_kind(model._meta.get_field(field)) for field in numeric
+        },
+        "dictionaries": {},
+    }
+    columns = {
+        "pk": np.array([row["pk"] for row in rows], dtype=np.int64),
+        # column-major, every column is contiguous
+        "numeric": np.asfortranarray(
+            np.array(
+                [
+                    [np.nan if row[f] is None else float(row[f]) for f in numeric]
+                    for row in rows
+                ],
+                dtype=np.float64,
+            ).reshape(len(rows), len(numeric))
+        ),
+    }
+    for field in values:
+        dictionary = {}
+        columns[f"{field}.codes"] = np.array(
+            encode((row[field] for row in rows), dictionary), dtype=np.int32
+        )
+        meta["dictionaries"][field] = list(dictionary)
+    for field in arrays:
+        dictionary = {}
+        lengths = [len(row[field] or []) for row in rows]
+        columns[f"{field}.offsets"] = np.concatenate(
+            [[0], np.cumsum(lengths, dtype=np.int64)]
+        ).astype(np.int64)
+        columns[f"{field}.items"] = np.array(
+            encode((item for row in rows for item in row[field] or []), dictionary),
+            dtype=np.int32,
+        )
+        meta["dictionaries"][field] = list(dictionary)
+    return meta, columns
+
+
+def save_arrays(path: Path, meta: dict, arrays: dict):
+    """
+    Write to a temporary directory renamed into place, readers never see a
+    partial copy. When another process won the race its copy is kept.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=".tmp-"))
+    try:
+        for name, array in arrays.items():
+            np.save(tmp / f"{name}.npy", array)
+        (tmp / "arrays.json").write_text(json.dumps(list(arrays)))
+        (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False))
+        os.rename(tmp, path)
+    except OSError:
+        if not (path / "meta.json").exists():
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_arrays(path: Path) -> tuple[dict, dict]:
+    """Raises FileNotFoundError when the copy is removed while it is read."""
+    meta = json.loads((path / "meta.json").read_text())
+    arrays = {
+        name: np.load(path / f"{name}.npy", mmap_mode="r")
+        for name in json.loads((path / "arrays.json").read_text())
+    }
+    return meta, arrays
+
+
+def remove_old_versions(root: Path, name: str, version: int):
+    """
+    Remove the copies of ``name`` older than the version before ``version``.
+    The previous copy stays for the processes that are about to map it,
+    processes that already map a removed one keep working.
+    """
+    versions = []
+    for path in root.glob(f"{name}-*"):
+        suffix = path.name.removeprefix(f"{name}-")
+        if suffix.isdigit():
+            versions.append((int(suffix), path))
+    older = sorted(v for v in versions if v[0] < version)
+    for _, path in older[:-1]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def versioned_arrays(name: str, version, build) -> tuple[dict, dict]:
+    """
+    Meta and arrays of ``name`` at a catalog version, mapped from
+    CATALOG_SNAPSHOT_DIR when set. ``build()`` runs once per version and host.
+    """
+    if not settings.CATALOG_SNAPSHOT_DIR:
+        return build()
+    root = Path(settings.CATALOG_SNAPSHOT_DIR)
+    path = root / f"{name}-{version}"
+    if not (path / "meta.json").exists():
+        save_arrays(path, *build())
+        remove_old_versions(root, name, int(version))
+    try:
+        return load_arrays(path)
+    except FileNotFoundError:
+        # removed meanwhile, by writers of two newer versions
+        return build()
+
+
+class CatalogSnapshot:
+    """
+    Rows of a catalog version in primary key order. ``arrays`` holds "pk",
+    the "numeric" matrix, "<field>.codes" of value fields and the CSR-style
+    "<field>.offsets"/"<field>.items" of array fields; ``meta`` the column
+    names, number kinds and the dictionaries of the codes.
+    """
+
+    def __init__(self, model, version, meta: dict, arrays: dict):
+        self.model = model
+        self.version = version
+        self.meta = meta
+        self.size = meta["size"]
+        self.kinds = meta["kinds"]
+        self.columns = {field: i for i, field in enumerate(meta["numeric"])}
+        self.dictionaries = meta["dictionaries"]
+        self.codes = {
+            field: {value: code for code, value in enumerate(dictionary)}
+            for field, dictionary in self.dictionaries.items()
+        }
+        self.arrays = arrays
+        self.pks = arrays["pk"]
+        self.numeric = arrays["numeric"]
+
+    def number(self, field) -> np.ndarray:
+        return self.numeric[:, self.columns[field]]
+
+    def decode_number(self, field, value):
+        if np.isnan(value):
+            return None
+        if self.kinds[field] == "int":
+            return int(value)
+        if self.kinds[field] == "decimal":
+            return Decimal(repr(float(value)))
+        return float(value)
+
+    def equals(self, field, value) -> np.ndarray:
+        return self.arrays[f"{field}.codes"] == self.codes[field].get(value, -2)
+
+    def item_rows(self, field) -> np.ndarray:
+        """Row of every array item of a field."""
+        offsets = self.arrays[f"{field}.offsets"]
+        return np.repeat(np.arange(self.size), np.diff(offsets))
+
+    def contains_any(self, field, values) -> np.ndarray:
+        codes = [
+            self.codes[field][value] for value in values if value in self.codes[field]
+        ]
+        mask = np.zeros(self.size, dtype=bool)
+        items = self.arrays[f"{field}.items"]
+        mask[self.item_rows(field)[np.isin(items, codes)]] = True
+        return mask
+
+    def distance(self, spec_filter: Near, lat, lon) -> np.ndarray:
+        return haversine_km_array(
+            lat,
+            lon,
+            self.number(spec_filter.lat_field),
+            self.number(spec_filter.lon_field),
+        )
+
+    def test(self, spec_filter, value) -> np.ndarray:
+        """Rows passing one filter, the same rows as its lookups select."""
+        # NaN compares false, like NULL in the lookups
+        if isinstance(spec_filter, Near):
+            lat, lon, radius = value
+            return self.distance(spec_filter, lat, lon) <= radius
+        if isinstance(spec_filter, Contains):
+            value = float(value)
+            return (self.number(spec_filter.min_field) <= value) & (
+                value <= self.number(spec_filter.max_field)
+            )
+        if isinstance(spec_filter, Range):
+            min_value, max_value = value
+            mask = np.ones(self.size, dtype=bool)
+            if min_value is not None:
+                mask &= self.number(spec_filter.min_field) >= float(min_value)
+            if max_value is not None:
+                mask &= self.number(spec_filter.max_field) <= float(max_value)
+            return mask
+        if isinstance(spec_filter, Overlap):
+            return self.contains_any(spec_filter.field, value)
+        if isinstance(spec_filter, Search):
+            return np.isin(self.pks, spec_filter.pks(self.model, value))
+        return self.equals(spec_filter.field, value)
+
+    def match(self, spec, submission) -> np.ndarray:
+        """In-memory equivalent of filtering by the compiled Q, as a row mask."""
+        mask = np.ones(self.size, dtype=bool)
+        for spec_filter in spec:
+            value = spec_filter.value(submission)
+            if value is not None:
+                mask &= self.test(spec_filter, value)
+        return mask
+
+    def value(self, field, row: int):
+        if field in self.columns:
+            return self.decode_number(field, self.numeric[row, self.columns[field]])
+        dictionary = self.dictionaries[field]
+        if f"{field}.codes" in self.arrays:
+            code = self.arrays[f"{field}.codes"][row]
+            return None if code < 0 else dictionary[code]
+        offsets = self.arrays[f"{field}.offsets"]
+        start, end = offsets[row], offsets[row + 1]
+        return [dictionary[code] for code in self.arrays[f"{field}.items"][start:end]]
+
+    def rows(self, fields) -> list[dict]:
+        """Plain row dicts of the snapshot, in primary key order."""
+        return [
+            {field: self.value(field, row) for field in fields}
+            for row in range(self.size)
+        ]
+
+    def facets(self, mask, range_fields, value_fields, array_fields) -> dict:
+        """
+        Count of the rows in the mask, min/max of their range fields and the
+        distinct values of the rest.
+        """
+        facets = {"count": int(mask.sum()), "min": {}, "max": {}, "values": {}}
+        for field in range_fields:
+            column = self.number(field)[mask]
+            column = column[~np.isnan(column)]
+            if column.size:
+                facets["min"][field] = self.decode_number(field, column.min())
+                facets["max"][field] = self.decode_number(field, column.max())
+            else:
+                facets["min"][field] = facets["max"][field] = None
+        for field in value_fields + array_fields:
+            if field in value_fields:
+                codes = self.arrays[f"{field}.codes"][mask]
+            else:
+                codes = self.arrays[f"{field}.items"][mask[self.item_rows(field)]]
+            dictionary = self.dictionaries[field]
+            facets["values"][field] = sorted(
+                dictionary[code] for code in np.unique(codes) if code >= 0
+            )
+        return facets
+
+
+_snapshots = {}
+
+
+def get_catalog_snapshot(model, spec) -> CatalogSnapshot:
+    """Per-process snapshot of the current catalog version."""
+    version = get_catalog_version(model)
+    model_name = model._meta.model_name
+    snapshot = _snapshots.get(model_name)
+    if snapshot is None or snapshot.version != version:
+        meta, arrays = versioned_arrays(
+            model_name, version, lambda: snapshot_columns(model, spec)
+        )
+        snapshot = _snapshots[model_name] = CatalogSnapshot(
+            model, version, meta, arrays
+        )
+    return snapshot
@@ -1,31 +1,41 @@
+import hashlib
 import json
-from ast import literal_eval
+import logging
+import random
+import uuid
 from contextlib import contextmanager
 
-import requests
 from celery import shared_task
 from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
 
+from invest_advisor.chat import ml
 from invest_advisor.chat.api.serializers import (
     BuildingSubmissionSerializer,
-    BuildingTableDataSerializer,
     TechnoparkSubmissionSerializer,
-    TechnoparkTableDataSerializer,
+    get_place_projection,
 )
+from invest_advisor.chat.embeddings import get_embedding_index, semantic_candidates
 from invest_advisor.chat.models import (
-    BuildingModel,
     BuildingSubmission,
     Chat,
     ChatMessage,
-    Technopark,
     TechnoparkSubmission,
 )
+from invest_advisor.chat.reports import report_file_name
+from invest_advisor.chat.scoring import rank_places
 from invest_advisor.chat.services import (
+    PLACE_FILTERS,
     filter_buildings,
     filter_technoparks,
     generate_report_file,
+    send_to_chat,
 )
+from invest_advisor.chat.signals import push_chat_message
+from invest_advisor.chat.snapshot import get_catalog_snapshot
+
+logger = logging.getLogger(__name__)
 
 
 @contextmanager
@@ -39,116 +49,161 @@ def redis_lock(lock_id, timeout=60):
             cache.delete(lock_id)
 
 
-def send_technopark(submission: TechnoparkSubmission):
+SUBMISSIONS = {
+    "technopark": (
+        TechnoparkSubmission,
+        TechnoparkSubmissionSerializer,
+        filter_technoparks,
+    ),
+    "building": (BuildingSubmission, BuildingSubmissionSerializer, filter_buildings),
+}
+
+
+# Free-text wishes of a submission, matched against the catalog descriptions
+PREFERENCE_FIELDS = {
+    "technopark": "additional_preferences",
+    "building": "additional_comments",
+}
+
+NAMES_CHUNK_SIZE = 2000
+
+
+def preferred_places(type: str, submission) -> list | None:
+    """
+    Primary keys of the ML_SEMANTIC_CANDIDATES places passing the filters
+    of a submission that are closest to its free-text preferences. None when
+    the filters leave no more places than that or the text narrows nothing.
+    """
+    model, spec = PLACE_FILTERS[type]
+    snapshot = get_catalog_snapshot(model, spec)
+    filtered = snapshot.pks[snapshot.match(spec, submission)]
+    if filtered.size <= settings.ML_SEMANTIC_CANDIDATES:
+        return None
+    return semantic_candidates(
+        type,
+        getattr(submission, PREFERENCE_FIELDS[type]),
+        settings.ML_SEMANTIC_CANDIDATES,
+        pks=filtered,
+    )
+
+
+def conversation_data(type: str, submission) -> dict:
+    """
+    With ML_RANKED_PLACES the ML service gets the best ranked places, with
+    the criteria each of them misses, instead of every filtered name. When
+    the filters leave many places, free-text preferences first narrow them to
+    the ML_SEMANTIC_CANDIDATES closest ones.
+    """
+    _, serializer_class, filter_places = SUBMISSIONS[type]
     data = {
         "user_data": (
             json.dumps(submission.user.company_info)
             if submission.user and submission.user.company_info
             else ""
         ),
-        "names": [x.name for x in filter_technoparks(submission)],
         "uuid": str(submission.id),
-        "additional_filters": json.dumps(
-            TechnoparkSubmissionSerializer(submission).data
-        ),
+        "additional_filters": json.dumps(serializer_class(submission).data),
     }
-    r = requests.post(settings.ML_HOST + "/conversation", json=data, timeout=60)
-    if r.status_code != 200:
-        raise Exception(f"Failed to send data to ML: {r.text}")
-    data = r.json()
-    submission.ml_data = data
-    submission.save()
-    try:
-        c = Chat.objects.get(id=submission.id)
-    except Chat.DoesNotExist:
-        c = Chat.objects.create(
-            type="technopark",
-            id=submission.id,
-            name=submission.name,
-            user=submission.user,
+    candidates = preferred_places(type, submission)
+    if settings.ML_RANKED_PLACES:
+        ranking = rank_places(
+            type, submission, settings.ML_RANKED_PLACES, candidates=candidates
         )
-    try:
-        places = data["places"]
-        technoparks = Technopark.objects.filter(name__in=places)
-    except Exception as e:
-        print(f"Failed to get technoparks: {e}")
-        technoparks = []
-    try:
-        ChatMessage.objects.create(
-            chat=c,
-            from_user=False,
-            text=data["messages"][0]["text"],
-            data=TechnoparkTableDataSerializer(technoparks, many=True).data,
+        data["names"] = [place["name"] for place in ranking]
+        data["ranking"] = [
+            {
+                "name": place["name"],
+                "score": place["score"],
+                "misses": {
+                    name: match
+                    for name, match in place["criteria"].items()
+                    if match < 1
+                },
+            }
+            for place in ranking
+        ]
+    else:
+        places = filter_places(submission)
+        if candidates is not None:
+            places = places.filter(pk__in=candidates)
+        # streamed from a server-side cursor into the request body
+        data["names"] = places.values_list("name", flat=True).iterator(
+            chunk_size=NAMES_CHUNK_SIZE
         )
-    except Exception as e:
-        print(f"Failed to create chat message: {e}")
+    return data
 
 
-def send_building(submission: BuildingSubmission):
-    data = {
-        "user_data": (
-            json.dumps(submission.user.company_info)
-            if submission.user and submission.user.company_info
-            else ""
-        ),
-        "names": [x.name for x in filter_buildings(submission)],
-        "uuid": str(submission.id),
-        "additional_filters": json.dumps(BuildingSubmissionSerializer(submission).data),
-    }
-    r = requests.post(settings.ML_HOST + "/conversation", json=data, timeout=60)
-    if r.status_code != 200:
-        raise Exception(f"Failed to send data to ML: {r.text}")
-    data = r.json()
-    submission.ml_data = data
-    submission.save()
-    try:
-        c = Chat.objects.get(id=submission.id)
-    except Chat.DoesNotExist:
-        c = Chat.objects.create(
-            type="building",
-            id=submission.id,
-            name=submission.name,
-            user=submission.user,
+def save_conversations(type: str, submissions: list, replies: list[dict]):
+    """
+    Store ML replies of submissions and post the first reply message to their
+    chats. Place names are resolved from the catalog projection, the rest
+    takes one query per table whatever the number of submissions.
+    """
+    submission_model = SUBMISSIONS[type][0]
+    projection = get_place_projection(type)
+    places = []
+    for submission, reply in zip(submissions, replies):
+        pks, unmatched = projection.resolve(reply["places"])
+        if unmatched:
+            logger.warning(
+                "Places of %s not found in the catalog: %s", submission.id, unmatched
+            )
+        places.append(pks)
+    with transaction.atomic():
+        for submission, reply in zip(submissions, replies):
+            submission.ml_data = reply
+        submission_model.objects.bulk_update(submissions, ["ml_data"])
+        # chats are created with their submissions, this only fills the gaps
+        Chat.objects.bulk_create(
+            [
+                Chat(type=type, id=s.id, name=s.name, user_id=s.user_id)
+                for s in submissions
+            ],
+            ignore_conflicts=True,
         )
-    try:
-        places = data["places"]
-        buildings = BuildingModel.objects.filter(name__in=places)
-    except Exception as e:
-        print(f"Failed to get buildings: {e}")
-        buildings = []
-
-    try:
-        ChatMessage.objects.create(
-            chat=c,
-            from_user=False,
-            text=data["messages"][0]["text"],
-            data=BuildingTableDataSerializer(buildings, many=True).data,
+        messages = ChatMessage.objects.bulk_create(
+            [
+                ChatMessage(
+                    chat_id=submission.id,
+                    from_user=False,
+                    text=reply["messages"][0]["text"],
+                    place_type=type,
+                    place_ids=pks,
+                )
+                for submission, reply, pks in zip(submissions, replies, places)
+            ]
         )
-    except Exception as e:
-        print(f"Failed to create chat message: {e}")
+        # bulk_create skips the post_save signal that pushes new messages
+        for message in messages:
+            push_chat_message(ChatMessage, message)
+
+
+def send_technopark(submission: TechnoparkSubmission):
+    reply = ml.conversation(conversation_data("technopark", submission))
+    save_conversations("technopark", [submission], [reply])
+
+
+def send_building(submission: BuildingSubmission):
+    reply = ml.conversation(conversation_data("building", submission))
+    save_conversations("building", [submission], [reply])
 
 
 def send_message(message: ChatMessage):
     data = {
         "message": message.text,
     }
-    r = requests.post(
-        settings.ML_HOST + "/conversation/" + str(message.chat.id),
-        json=data,
-        timeout=60,
-    )
-    if r.status_code != 200:
-        raise Exception(f"Failed to send data to ML: {r.text}")
-    data = r.json()
-    print(data)
+    chunks = []
+    for chunk in ml.stream(ml.MESSAGE, "/conversation/" + str(message.chat.id), data):
+        chunks.append(chunk)
+        send_to_chat(message.chat_id, {"type": "chat.chunk", "text": chunk})
     try:
         ChatMessage.objects.create(
             chat=message.chat,
             from_user=False,
-            text=data["messages"][-1]["text"],
+            text="".join(chunks),
         )
-    except Exception as e:
-        print(f"Failed to create chat message: {e}")
+    except Exception:
+        logger.exception("Failed to create chat message")
 
 
 def generate_place_report(chat, place):
@@ -157,24 +212,22 @@ def generate_place_report(chat, place):
         "user_data": json.dumps(user_data),
         "place_name": place,
     }
-    r = requests.post(
-        settings.ML_HOST + "/places/advice_and_support", json=data, timeout=60
+    key = (
+        "place_reply:"
+        + hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
     )
-    if r.status_code != 200:
-        raise Exception(f"Failed to send data to ML: {r.text}")
-    data = r.json()
-    generate_report(chat.id, data["advice"], data["support"], place)
-    return
+    reply = cache.get(key)
+    if reply is None:
+        reply = ml.advice_and_support(data)
+        cache.set(key, reply, settings.REPORT_CACHE_TIMEOUT)
+    generate_report(chat.id, reply["advice"], reply["support"], place)
 
 
 def generate_chat_name(submission, chat):
     data = {
         "place_names": submission.ml_data["places"],
     }
-    r = requests.post(settings.ML_HOST + "/generate_name", json=data, timeout=60)
-    if r.status_code != 200:
-        raise Exception(f"Failed to send data to ML: {r.text}")
-    name = literal_eval(r.text).strip('"').replace("\\n", "").strip()
+    name = ml.generate_name(data)
     chat.name = name
     chat.save()
     submission.name = name
@@ -183,42 +236,179 @@ def generate_chat_name(submission, chat):
 
 def generate_report(chat_id, advise, support, place):
     chat = Chat.objects.get(id=chat_id)
+    name = report_file_name(support, advise)
+    if ChatMessage.file.field.storage.exists(name):
+        # the same report was rendered before, reuse the file
+        ChatMessage.objects.create(chat=chat, from_user=False, text=place, file=name)
+        return
     message = ChatMessage.objects.create(chat=chat, from_user=False, text=place)
+    render_report.delay(message.id, support, advise)
+
+
+@shared_task(ignore_result=True)
+def build_catalog_index(place_type: str):
+    """
+    Write the snapshot and embeddings of the current catalog version to
+    CATALOG_SNAPSHOT_DIR, so the ML tasks of the version only map them.
+    """
+    model, spec = PLACE_FILTERS[place_type]
+    get_catalog_snapshot(model, spec)
+    get_embedding_index(place_type)
+
+
+@shared_task(ignore_result=True)
+def render_report(message_id, support, advise):
+    """Routed to the "reports" queue, so rendering never holds the ML locks."""
+    message = ChatMessage.objects.get(id=message_id)
     generate_report_file(message, support, advise)
 
 
-@shared_task(bind=True, ignore_result=True)
+def get_task_chat_id(type: str, obj_id):
+    """Every ML task belongs to a chat; messages are the only ones keyed by their own id."""
+    if type == "message":
+        return ChatMessage.objects.values_list("chat_id", flat=True).get(id=obj_id)
+    return obj_id
+
+
+@contextmanager
+def ml_semaphore(timeout=60):
+    """Take one of ML_MAX_CONCURRENCY slots, yields the slot key or None if all are busy."""
+    slots = list(range(settings.ML_MAX_CONCURRENCY))
+    random.shuffle(slots)
+    for slot in slots:
+        slot_id = f"ml_slot:{slot}"
+        with redis_lock(slot_id, timeout=timeout) as acquired:
+            if acquired:
+                yield slot_id
+                return
+    yield None
+
+
+def run_ml_task(type: str, obj_id, extra_data: dict = None):
+    if type == "technopark":
+        submission = TechnoparkSubmission.objects.get(id=obj_id)
+        send_technopark(submission)
+        send_data_to_ml.apply_async(
+            kwargs={"type": "name", "obj_id": submission.id}, countdown=1
+        )
+    elif type == "building":
+        submission = BuildingSubmission.objects.get(id=obj_id)
+        send_building(submission)
+        send_data_to_ml.apply_async(
+            kwargs={"type": "name", "obj_id": submission.id}, countdown=1
+        )
+    elif type == "message":
+        message = ChatMessage.objects.get(id=obj_id)
+        send_message(message)
+    elif type == "file":
+        chat = Chat.objects.get(id=obj_id)
+        place = extra_data["name"]
+        generate_place_report(chat, place)
+    elif type == "name":
+        chat = Chat.objects.get(id=obj_id)
+        if chat.type == "technopark":
+            submission = TechnoparkSubmission.objects.get(id=obj_id)
+        elif chat.type == "building":
+            submission = BuildingSubmission.objects.get(id=obj_id)
+        generate_chat_name(submission, chat)
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=None)
 def send_data_to_ml(self, type: str, obj_id, extra_data: dict = None):
-    lock_id = "ml_lock"
-    with redis_lock(lock_id, timeout=60) as acquired:
-        if acquired:
-            print(f"Lock acquired. Executing task {type}, {self.request.id}")
-            if type == "technopark":
-                submission = TechnoparkSubmission.objects.get(id=obj_id)
-                send_technopark(submission)
-                send_data_to_ml.apply_async(
-                    kwargs={"type": "name", "obj_id": submission.id}, countdown=1
-                )
-            elif type == "building":
-                submission = BuildingSubmission.objects.get(id=obj_id)
-                send_building(submission)
-                send_data_to_ml.apply_async(
-                    kwargs={"type": "name", "obj_id": submission.id}, countdown=1
+    """
+    Tasks of one chat run one at a time, tasks of different chats run in parallel
+    up to ML_MAX_CONCURRENCY. Blocked tasks are requeued instead of being dropped.
+    """
+    chat_id = get_task_chat_id(type, obj_id)
+    countdown = settings.ML_RETRY_COUNTDOWN + random.random()
+    with redis_lock(f"ml_lock:{chat_id}", timeout=settings.ML_LOCK_TIMEOUT) as locked:
+        if not locked:
+            logger.warning(
+                "Task %s, %s requeued, chat %s is busy.", type, self.request.id, chat_id
+            )
+            raise self.retry(countdown=countdown)
+        with ml_semaphore(timeout=settings.ML_LOCK_TIMEOUT) as slot:
+            if slot is None:
+                logger.warning(
+                    "Task %s, %s requeued, no free ML slots.", type, self.request.id
                 )
-            elif type == "message":
-                message = ChatMessage.objects.get(id=obj_id)
-                send_message(message)
-            elif type == "file":
-                chat = Chat.objects.get(id=obj_id)
-                place = extra_data["name"]
-                generate_place_report(chat, place)
-            elif type == "name":
-                chat = Chat.objects.get(id=obj_id)
-                if chat.type == "technopark":
-                    submission = TechnoparkSubmission.objects.get(id=obj_id)
-                elif chat.type == "building":
-                    submission = BuildingSubmission.objects.get(id=obj_id)
-                generate_chat_name(submission, chat)
-            print(f"Task {type}, {self.request.id} executed.")
+                raise self.retry(countdown=countdown)
+            logger.info(
+                "Slot %s acquired. Executing task %s, %s", slot, type, self.request.id
+            )
+            run_ml_task(type, obj_id, extra_data)
+            logger.info("Task %s, %s executed.", type, self.request.id)
+
+
+BULK_PROGRESS_TIMEOUT = 60 * 60 * 24
+BULK_COUNTERS = ["batches_done", "done", "failed"]
+
+
+def start_bulk_submit(type: str, ids: list) -> dict:
+    """Queue submissions in batches of ML_BATCH_SIZE, returns the job progress."""
+    job_id = str(uuid.uuid4())
+    batches = []
+    for start in range(0, len(ids), settings.ML_BATCH_SIZE):
+        stop = start + settings.ML_BATCH_SIZE
+        batches.append(ids[start:stop])
+    prefix = f"ml_bulk:{job_id}"
+    cache.set_many(
+        {
+            f"{prefix}:type": type,
+            f"{prefix}:total": len(ids),
+            f"{prefix}:batches": len(batches),
+            **{f"{prefix}:{counter}": 0 for counter in BULK_COUNTERS},
+        },
+        BULK_PROGRESS_TIMEOUT,
+    )
+    for batch in batches:
+        send_batch_to_ml.delay(type, [str(pk) for pk in batch], job_id)
+    return get_bulk_progress(job_id)
+
+
+def get_bulk_progress(job_id: str) -> dict | None:
+    prefix = f"ml_bulk:{job_id}"
+    keys = ["type", "total", "batches"] + BULK_COUNTERS
+    values = cache.get_many([f"{prefix}:{key}" for key in keys])
+    if not values:
+        return None
+    return {"job_id": job_id} | {key: values.get(f"{prefix}:{key}", 0) for key in keys}
+
+
+@shared_task(bind=True, ignore_result=True, max_retries=None)
+def send_batch_to_ml(self, type: str, ids: list, job_id: str):
+    """
+    One ML call (or one slot, without ML_BATCH_CONVERSATION) for a batch of
+    submissions instead of a locked task per submission.
+    """
+    countdown = settings.ML_RETRY_COUNTDOWN + random.random()
+    with ml_semaphore(timeout=settings.ML_LOCK_TIMEOUT) as slot:
+        if slot is None:
+            logger.warning(
+                "Batch %s of %s requeued, no free ML slots.", self.request.id, job_id
+            )
+            raise self.retry(countdown=countdown)
+        submission_model = SUBMISSIONS[type][0]
+        try:
+            submissions = list(
+                submission_model.objects.filter(id__in=ids).select_related("user")
+            )
+            replies = ml.conversation_batch(
+                [conversation_data(type, submission) for submission in submissions]
+            )
+            save_conversations(type, submissions, replies)
+        except Exception:
+            # a batch is not retried, it counts as failed so the job still completes
+            logger.exception("Batch %s of %s failed", self.request.id, job_id)
+            cache.incr(f"ml_bulk:{job_id}:failed", len(ids))
+            submissions = []
         else:
-            print(f"Task {type} skipped, lock not acquired.")
+            cache.incr(f"ml_bulk:{job_id}:done", len(submissions))
+            if len(submissions) < len(ids):
+                cache.incr(f"ml_bulk:{job_id}:failed", len(ids) - len(submissions))
+        finally:
+            cache.incr(f"ml_bulk:{job_id}:batches_done")
+    for submission in submissions:
+        send_data_to_ml.apply_async(
+            kwargs={"type": "name", "obj_id": submission.id}, countdown=1
+        )
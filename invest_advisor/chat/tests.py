@@ -0,0 +1,574 @@
+import json
+import threading
+import time
+from decimal import Decimal
+
+import numpy as np
+import pytest
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Min
+
+from invest_advisor.chat import ml, services, tasks
+from invest_advisor.chat.api.serializers import get_place_projection
+from invest_advisor.chat.catalog import bump_catalog_version
+from invest_advisor.chat.embeddings import semantic_candidates
+from invest_advisor.chat.facets import get_building_facets, get_technopark_facets
+from invest_advisor.chat.filters import (
+    BUILDING_FILTERS,
+    building_q,
+    matches,
+    model_fields,
+)
+from invest_advisor.chat.importers import import_catalog
+from invest_advisor.chat.models import (
+    BuildingModel,
+    BuildingSubmission,
+    Chat,
+    ChatMessage,
+    Technopark,
+    TechnoparkSubmission,
+)
+from invest_advisor.chat.routing import websocket_urlpatterns
+from invest_advisor.chat.scoring import rank_places
+from invest_advisor.chat.services import (
+    TECHNOPARK_QUESTION_FIELDS,
+    facet_fields,
+    filter_buildings,
+    filter_technoparks,
+    get_building_question_fields,
+)
+from invest_advisor.chat.snapshot import get_catalog_snapshot
+from invest_advisor.chat.tasks import ml_semaphore, redis_lock, render_report
+
+
+def test_ml_semaphore_is_bounded(settings):
+    settings.ML_MAX_CONCURRENCY = 2
+    with ml_semaphore() as first, ml_semaphore() as second:
+        assert first and second and first != second
+        with ml_semaphore() as third:
+            assert third is None
+    with ml_semaphore() as slot:
+        assert slot is not None
+
+
+def test_chat_locks_are_independent():
+    with redis_lock("ml_lock:chat-1") as first:
+        with redis_lock("ml_lock:chat-1") as same_chat:
+            assert first and not same_chat
+        with redis_lock("ml_lock:chat-2") as other_chat:
+            assert other_chat
+    assert cache.get("ml_lock:chat-1") is None
+
+
+def test_ml_session_is_reused_and_latency_recorded(settings):
+    settings.ML_HOST = "http://ml.invalid"
+    assert ml.get_session() is ml.get_session()
+    with pytest.raises(ml.MLError):
+        ml.generate_name({"place_names": []})
+    stats = ml.get_latency_stats()[ml.GENERATE_NAME]
+    assert stats["count"] >= 1 and stats["errors"] >= 1
+
+
+def test_iter_stream_chunks():
+    lines = [
+        'data: {"text": "Hel"}',
+        "",
+        ": keep-alive",
+        'data: {"text": "lo"}',
+        "data: [DONE]",
+        'data: {"text": "ignored"}',
+    ]
+    assert "".join(ml.iter_stream_chunks(lines)) == "Hello"
+
+
+def test_ml_replies_are_decoded_and_validated(settings, monkeypatch):
+    assert ml.decode_text(repr("Меры 'поддержки'\n\x07")) == "Меры 'поддержки'\n\x07"
+    assert ml.decode_text('"Совет \\"A\\""') == 'Совет "A"'
+    assert ml.decode_text("plain text") == "plain text"
+    monkeypatch.setattr(ml, "post_json", lambda *args: {"messages": [], "places": []})
+    with pytest.raises(ml.MLError):
+        ml.conversation({})
+    settings.ML_MAX_REPLY_SIZE = 10
+    with pytest.raises(ml.MLError):
+        list(ml.iter_stream_chunks(['data: {"text": "Hello, world"}']))
+
+
+def test_ml_payload_is_encoded_incrementally():
+    data = {"names": iter(["a", "б"]), "items": [{"x": 1.5, "y": None}], "s": '"'}
+    chunks = list(ml.iter_body(data, chunk_size=8))
+    assert len(chunks) > 1
+    assert json.loads(b"".join(chunks)) == {**data, "names": ["a", "б"]}
+    assert ml.has_iterator({"items": [data]})
+    assert not ml.has_iterator({"items": [{"names": ["a", "б"]}]})
+
+
+@pytest.fixture
+def catalog(db, settings):
+    call_command("loaddata", str(settings.ROOT_DIR / "data" / "data.json"))
+    # on_commit hooks never run inside the test transaction
+    bump_catalog_version(Technopark)
+    bump_catalog_version(BuildingModel)
+
+
+def sql_facets(places, questions) -> dict:
+    """The facets of a filtered queryset, computed in SQL."""
+    range_fields, value_fields, array_fields = facet_fields(questions)
+    sql, params = places.values(
+        *range_fields, *value_fields, *array_fields
+    ).query.sql_with_params()
+    qn = connection.ops.quote_name
+    selects = ["count(*)"]
+    for field in range_fields:
+        selects += [f"min({qn(field)})", f"max({qn(field)})"]
+    for field in value_fields:
+        selects.append(
+            f"array_agg(DISTINCT {qn(field)}) FILTER (WHERE {qn(field)} IS NOT NULL)"
+        )
+    for field in array_fields:
+        selects.append(f"ARRAY(SELECT DISTINCT v FROM b, unnest(b.{qn(field)}) v)")
+    with connection.cursor() as cursor:
+        cursor.execute(f"WITH b AS ({sql}) SELECT {', '.join(selects)} FROM b", params)
+        row = list(cursor.fetchone())
+
+    facets = {"count": row.pop(0), "min": {}, "max": {}, "values": {}}
+    for field in range_fields:
+        facets["min"][field], facets["max"][field] = row.pop(0), row.pop(0)
+    for field in value_fields + array_fields:
+        facets["values"][field] = set(row.pop(0) or [])
+    return facets
+
+
+def assert_same_facets(facets, expected):
+    assert facets["count"] == expected["count"]
+    assert facets["min"] == expected["min"] and facets["max"] == expected["max"]
+    assert {
+        field: set(values) for field, values in facets["values"].items()
+    } == expected["values"]
+
+
+def test_technopark_facets_match_queries(
+    catalog, user, client, django_assert_num_queries
+):
+    submission = TechnoparkSubmission.objects.create(
+        user=user,
+        name="test",
+        max_total_square=500000,
+        list_of_activities=["Производство мебели", "Производство напитков"],
+        free_custom_zone=True,
+    )
+    technoparks = filter_technoparks(submission)
+    assert 0 < technoparks.count() < Technopark.objects.count()
+    get_technopark_facets(submission)
+    with django_assert_num_queries(0):
+        facets = get_technopark_facets(submission)
+    assert_same_facets(facets, sql_facets(technoparks, TECHNOPARK_QUESTION_FIELDS))
+    response = client.get(f"/api/chat/technopark/{submission.id}/question/1/options/")
+    assert response.status_code == 200
+    assert response.json()["next_question"] == 2
+
+
+def test_building_facets_match_queries(catalog, user):
+    submission = BuildingSubmission.objects.create(
+        user=user, name="test", water_supply_available=True
+    )
+    buildings = filter_buildings(submission)
+    facets = get_building_facets(submission)
+    assert facets["count"] == buildings.count() > 0
+    assert (
+        facets["min"]["cost_object"]
+        == buildings.aggregate(Min("cost_object"))["cost_object__min"]
+    )
+    site_formats = set()
+    for value in buildings.values_list("site_format", flat=True):
+        site_formats.update(value or [])
+    assert set(facets["values"]["site_format"]) == site_formats
+    assert set(facets["values"]["region"]) == set(
+        buildings.exclude(region=None).values_list("region", flat=True)
+    )
+
+
+def test_building_facets_api(catalog, user, client):
+    submission = BuildingSubmission.objects.create(user=user, name="test")
+    response = client.get(f"/api/chat/building/{submission.id}/options/")
+    assert response.status_code == 200
+    assert response.json()["questions"]["3"]["next_question"] == 4
+
+
+def test_building_filter_spec_matches_queries(catalog):
+    submission = BuildingSubmission(
+        site_format=["Свободная земля"],
+        max_cost_object=10_000_000,
+        gas_supply_available=True,
+        gas_supply_rate_consumption=1,
+    )
+    rows = BuildingModel.objects.values("id", *model_fields(BUILDING_FILTERS))
+    expected = set(filter_buildings(submission).values_list("id", flat=True))
+    assert {
+        row["id"] for row in rows if matches(BUILDING_FILTERS, submission, row)
+    } == expected
+    questions = get_building_question_fields(submission)
+    assert questions[7]["next"] == 10
+    assert questions[10]["next"] == 11
+
+
+def test_filter_results_are_cached_per_catalog_version(
+    catalog, django_assert_num_queries
+):
+    submission = TechnoparkSubmission(free_custom_zone=True)
+    same_filters = TechnoparkSubmission(free_custom_zone=True, name="other")
+    expected = set(filter_technoparks(submission).values_list("id", flat=True))
+    with django_assert_num_queries(1):
+        assert set(filter_technoparks(same_filters).values_list("id", flat=True)) == (
+            expected
+        )
+    Technopark.objects.filter(id__in=expected).update(free_custom_zone=False)
+    bump_catalog_version(Technopark)
+    assert not filter_technoparks(submission).exists()
+
+
+def test_import_catalog(db, settings):
+    counts = import_catalog(
+        BuildingModel, settings.ROOT_DIR / "data" / "cleared_buildings.xlsx"
+    )
+    assert counts["created"] == BuildingModel.objects.count() == 196
+    building = BuildingModel.objects.exclude(gas_supply_rate_consumption_min=None)[0]
+    assert building.gas_supply_rate_consumption_min < (
+        building.gas_supply_rate_consumption_max
+    )
+    assert BuildingModel.objects.filter(site_format__len__gt=0).exists()
+    assert not BuildingModel.objects.filter(search_vector=None).exists()
+
+    technoparks = settings.ROOT_DIR / "data" / "cleared_technoparks.xlsx"
+    import_catalog(Technopark, technoparks)
+    Technopark.objects.filter(name="Сколково").update(source_hash=None)
+    Technopark.objects.create(name="Удалённый технопарк", how_to_become_resident="")
+    counts = import_catalog(Technopark, technoparks, sync=True)
+    assert counts == {
+        "created": 0,
+        "updated": 1,
+        "deleted": 1,
+        "unchanged": 51,
+        "skipped": 0,
+    }
+    technopark = Technopark.objects.get(name="Сколково")
+    assert technopark.tax_income == Decimal("0.17")
+    assert technopark.list_of_activities[0] == (
+        "Деятельность профессиональная научная и техническая прочая"
+    )
+
+
+def test_render_report_in_process(db, settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    settings.REPORT_RENDERER = "xhtml2pdf"
+    chat = Chat.objects.create(type="technopark", name="test")
+    message = ChatMessage.objects.create(chat=chat, from_user=False, text="place")
+    render_report(message.id, "**Меры поддержки**", "- совет")
+    message.refresh_from_db()
+    with message.file.open("rb") as f:
+        assert f.read(4) == b"%PDF"
+
+
+def test_place_report_is_reused(db, settings, tmp_path, monkeypatch):
+    settings.MEDIA_ROOT = tmp_path
+    calls = []
+
+    def post_json(*args):
+        calls.append("ml")
+        return {"advice": repr("Совет"), "support": '"Меры"'}
+
+    def render_pdf(*args):
+        calls.append("render")
+        return b"%PDF-1.4"
+
+    monkeypatch.setattr(ml, "post_json", post_json)
+    monkeypatch.setattr(services, "render_pdf", render_pdf)
+    monkeypatch.setattr(tasks.render_report, "delay", tasks.render_report)
+    chat = Chat.objects.create(type="technopark", name="test")
+    cache.delete_pattern("place_reply:*")
+    tasks.generate_place_report(chat, "Сколково")
+    tasks.generate_place_report(chat, "Сколково")
+    assert calls == ["ml", "render"]
+    first, second = chat.messages.order_by("created")
+    assert first.file.name == second.file.name
+
+
+def test_bulk_submit_in_batches(catalog, client, settings, monkeypatch):
+    settings.ML_BATCH_CONVERSATION = True
+    settings.ML_BATCH_SIZE = 2
+    calls, named = [], []
+    names = list(Technopark.objects.values_list("name", flat=True)[:2])
+
+    def post_json(endpoint, path, data):
+        calls.append(len(data["items"]))
+        results = [
+            {"messages": [{"text": item["uuid"]}], "places": names}
+            for item in data["items"]
+        ]
+        return {"results": results}
+
+    monkeypatch.setattr(ml, "post_json", post_json)
+    monkeypatch.setattr(tasks.send_batch_to_ml, "delay", tasks.send_batch_to_ml)
+    monkeypatch.setattr(
+        tasks.send_data_to_ml, "apply_async", lambda kwargs, **_: named.append(kwargs)
+    )
+    submissions = [TechnoparkSubmission.objects.create() for _ in range(3)]
+    response = client.post(
+        "/api/chat/bulk/submit/",
+        {"type": "technopark", "ids": [str(s.id) for s in submissions]},
+        content_type="application/json",
+    )
+    assert response.status_code == 202
+    progress = client.get(f"/api/chat/bulk/{response.json()['job_id']}/").json()
+    assert progress["batches_done"] == 2 and progress["done"] == 3
+    assert calls == [2, 1] and len(named) == 3
+    message = ChatMessage.objects.get(chat_id=submissions[0].id)
+    assert message.text == str(submissions[0].id) and message.data is None
+    assert message.place_type == "technopark" and len(message.place_ids) >= 2
+    (row,) = client.get(f"/api/chat/{submissions[0].id}/messages/").json()["results"]
+    assert {place["name"] for place in row["data"]} == set(names)
+
+    # a batch that breaks outside the ML client still completes the job
+    def save_conversations(*args):
+        raise RuntimeError("broken reply")
+
+    monkeypatch.setattr(tasks, "save_conversations", save_conversations)
+    job = tasks.start_bulk_submit("technopark", [submissions[0].id])
+    progress = tasks.get_bulk_progress(job["job_id"])
+    assert progress["batches_done"] == 1 and progress["failed"] == 1
+
+
+def test_chat_messages_are_paginated_by_cursor(db, client):
+    chat = Chat.objects.create(type="technopark", name="test")
+    messages = [
+        ChatMessage.objects.create(chat=chat, from_user=True, text=str(i))
+        for i in range(3)
+    ]
+    url = f"/api/chat/{chat.id}/messages/"
+    page = client.get(url, {"page_size": 2}).json()
+    assert [m["text"] for m in page["results"]] == ["0", "1"]
+    assert [m["text"] for m in client.get(page["next"]).json()["results"]] == ["2"]
+    page = client.get(url, {"after": messages[1].id}).json()
+    assert [m["id"] for m in page["results"]] == [messages[2].id]
+    assert client.get(url, {"after": "x"}).status_code == 400
+
+
+def test_chat_messages_etag_and_long_poll(
+    db, client, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    chat = Chat.objects.create(type="technopark", name="test")
+    url = f"/api/chat/{chat.id}/messages/"
+    etag = client.get(url)["ETag"]
+    with django_assert_num_queries(0):
+        assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    response = client.get(url, {"page_size": 1}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        ChatMessage.objects.create(chat=chat, from_user=True, text="new")
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and response["ETag"] != etag
+    etag = response["ETag"]
+    bump_catalog_version(Technopark)
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and response["ETag"] != etag
+
+    etag = response["ETag"]
+    timer = threading.Timer(0.2, services.touch_chat_messages, [chat.id])
+    timer.start()
+    start = time.monotonic()
+    response = client.get(url, {"wait": 10}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and time.monotonic() - start < 5
+
+
+def test_catalog_projection_is_cached_per_version(catalog, django_assert_num_queries):
+    projection = get_place_projection("technopark")
+    name = 'ОЭЗ "Технополис "Москва" - площадка "Печатники"'
+    with django_assert_num_queries(0):
+        assert get_place_projection("technopark") is projection
+        pks, unmatched = projection.resolve(
+            ["unknown", "оэз «Технополис «Москва» –  площадка „Печатники“"]
+        )
+    assert [row["name"] for row in projection.table(pks)] == [name]
+    assert unmatched == ["unknown"]
+    bump_catalog_version(Technopark)
+    assert get_place_projection("technopark").version != projection.version
+
+
+def test_nearby_search(catalog, client):
+    # 25 km around the Kremlin covers Pechatniki and Rudnevo but not Zelenograd
+    point = {"near_lat": 55.752, "near_lon": 37.617, "radius_km": 25}
+    submission = BuildingSubmission(**point)
+    rows = BuildingModel.objects.values("id", *model_fields(BUILDING_FILTERS))
+    expected = set(filter_buildings(submission).values_list("id", flat=True))
+    assert 0 < len(expected) < len(rows)
+    assert {
+        row["id"] for row in rows if matches(BUILDING_FILTERS, submission, row)
+    } == expected
+
+    submission = TechnoparkSubmission(**point)
+    count = filter_technoparks(submission).count()
+    assert count == 2 and get_technopark_facets(submission)["count"] == 2
+
+    response = client.get(
+        "/api/chat/technopark/nearby/", {"lat": 55.752, "lon": 37.617, "k": 3}
+    )
+    distances = [row["distance_km"] for row in response.json()]
+    assert len(distances) == 3 and distances == sorted(distances)
+    assert 7 < distances[0] < 9
+
+
+def test_ranking_puts_filter_matches_first(catalog, client, settings):
+    submission = BuildingSubmission.objects.create(
+        max_cost_object=10_000_000, gas_supply_available=True
+    )
+    expected = set(filter_buildings(submission).values_list("id", flat=True))
+    total = BuildingModel.objects.count()
+    assert 0 < len(expected) < total
+    ranking = rank_places("building", submission, total)
+    assert len(ranking) == total
+    scores = [place["score"] for place in ranking]
+    assert scores == sorted(scores, reverse=True)
+    assert {place["pk"] for place in ranking if place["score"] == 1} == expected
+    assert set(ranking[-1]["criteria"]) == {"cost_object", "gas_supply_available"}
+
+    # nothing passes every filter, the closest places are still ranked
+    submission = TechnoparkSubmission.objects.create(
+        min_total_square=10**9, free_custom_zone=True
+    )
+    assert not filter_technoparks(submission).exists()
+    settings.ML_RANKED_PLACES = 3
+    data = tasks.conversation_data("technopark", submission)
+    assert len(data["names"]) == 3
+    assert all("total_square" in place["misses"] for place in data["ranking"])
+
+    response = client.get(f"/api/chat/technopark/{submission.id}/ranking/", {"k": 2})
+    assert response.status_code == 200
+    assert [row["name"] for row in response.json()] == data["names"][:2]
+
+
+def test_catalog_snapshot_matches_queries(
+    catalog, settings, tmp_path, django_assert_num_queries
+):
+    settings.CATALOG_SNAPSHOT_DIR = str(tmp_path)
+    snapshot = get_catalog_snapshot(BuildingModel, BUILDING_FILTERS)
+    assert isinstance(snapshot.numeric, np.memmap)
+    assert len(list(tmp_path.iterdir())) == 1
+    submissions = [
+        BuildingSubmission(max_cost_object=10_000_000, gas_supply_available=True),
+        BuildingSubmission(
+            site_format=["Свободная земля"],
+            gas_supply_available=True,
+            gas_supply_rate_consumption=1,
+        ),
+        BuildingSubmission(near_lat=55.752, near_lon=37.617, radius_km=25),
+    ]
+    for submission in submissions:
+        buildings = BuildingModel.objects.filter(building_q(submission))
+        mask = snapshot.match(BUILDING_FILTERS, submission)
+        assert set(snapshot.pks[mask]) == set(buildings.values_list("id", flat=True))
+        expected = sql_facets(buildings, get_building_question_fields(None))
+        with django_assert_num_queries(0):
+            assert_same_facets(get_building_facets(submission), expected)
+
+    # the previous version stays for readers that are about to map it
+    bump_catalog_version(BuildingModel)
+    get_catalog_snapshot(BuildingModel, BUILDING_FILTERS)
+    assert len(list(tmp_path.iterdir())) == 2
+    bump_catalog_version(BuildingModel)
+    latest = get_catalog_snapshot(BuildingModel, BUILDING_FILTERS)
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        f"buildingmodel-{latest.version - 1}",
+        f"buildingmodel-{latest.version}",
+    ]
+    assert np.array_equal(latest.pks, snapshot.pks)
+
+
+def test_full_text_search(catalog):
+    assert not BuildingModel.objects.filter(search_vector=None).exists()
+    submission = BuildingSubmission(search_query="пищевое производство")
+    buildings = list(filter_buildings(submission))
+    assert 0 < len(buildings) < BuildingModel.objects.count()
+    ranks = [building.search_rank for building in buildings]
+    assert ranks == sorted(ranks, reverse=True)
+    # stemmed: "пищевой" matches "пищевое"
+    stemmed = BuildingSubmission(search_query="пищевой", max_cost_object=10**12)
+    assert set(filter_buildings(stemmed)) >= set(buildings)
+
+    submission = TechnoparkSubmission(search_query="производство")
+    expected = set(filter_technoparks(submission).values_list("id", flat=True))
+    assert 0 < len(expected) < Technopark.objects.count()
+    assert get_technopark_facets(submission)["count"] == len(expected)
+    ranking = rank_places("technopark", submission, len(expected))
+    assert {place["pk"] for place in ranking if place["score"] == 1} == expected
+
+    technopark = Technopark.objects.exclude(id__in=expected).first()
+    technopark.another_benefits = "Льготы для производства"
+    technopark.save()
+    assert technopark.id in filter_technoparks(submission).values_list("id", flat=True)
+
+
+def test_semantic_candidates(catalog, settings, tmp_path):
+    settings.CATALOG_SNAPSHOT_DIR = str(tmp_path)
+    furniture = set(
+        Technopark.objects.filter(
+            list_of_activities__contains=["Производство мебели"]
+        ).values_list("id", flat=True)
+    )
+    top = semantic_candidates("technopark", "производим мебель", 3)
+    assert len(top) == 3 and set(top) <= furniture
+    others = Technopark.objects.exclude(id__in=furniture).values_list("id", flat=True)
+    narrowed = semantic_candidates("technopark", "производим мебель", 3, list(others))
+    assert len(narrowed) == 3 and not set(narrowed) & furniture
+    assert semantic_candidates("technopark", "", 3) is None
+    assert semantic_candidates("technopark", "qwerty", 3) is None
+    assert len(list(tmp_path.glob("embeddings-technopark-*"))) == 1
+
+    settings.ML_SEMANTIC_CANDIDATES = 3
+    submission = TechnoparkSubmission.objects.create(
+        additional_preferences="производим мебель"
+    )
+    data = tasks.conversation_data("technopark", submission)
+    assert set(
+        Technopark.objects.filter(name__in=data["names"]).values_list("id", flat=True)
+    ) == set(top)
+
+
+def test_chat_consumer_streams_reply(transactional_db, monkeypatch):
+    chat = Chat.objects.create(type="technopark", name="test")
+    monkeypatch.setattr(ml, "stream", lambda *args: iter(["Hel", "lo"]))
+    monkeypatch.setattr(
+        tasks.send_data_to_ml,
+        "apply_async",
+        lambda kwargs, **options: tasks.send_message(
+            ChatMessage.objects.get(id=kwargs["obj_id"])
+        ),
+    )
+
+    async def chat_events():
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f"/ws/chat/{chat.id}/"
+        )
+        connected, _ = await communicator.connect()
+        assert connected
+        await communicator.send_json_to({"type": "text"})
+        events = [await communicator.receive_json_from()]
+        await communicator.send_json_to({"type": "message", "text": "hi"})
+        events += [await communicator.receive_json_from() for _ in range(4)]
+        await communicator.disconnect()
+        return events
+
+    error, question, *chunks, reply = async_to_sync(chat_events)()
+    assert error["type"] == "error"
+    assert question["type"] == "message" and question["data"]["text"] == "hi"
+    assert chunks == [{"type": "chunk", "data": {"text": t}} for t in ["Hel", "lo"]]
+    assert reply["type"] == "message" and reply["data"]["text"] == "Hello"
+    assert not reply["data"]["from_user"]
+    assert list(chat.messages.order_by("created").values_list("text", flat=True)) == [
+        "hi",
+        "Hello",
+    ]
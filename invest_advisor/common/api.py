@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class SmallResultsSetPagination(PageNumberPagination):
@@ -17,3 +17,12 @@ class BigResultsSetPagination(PageNumberPagination):
     page_size = 100
     page_size_query_param = "page_size"
     max_page_size = 1000
+
+
+class CreatedCursorPagination(CursorPagination):
+    """Oldest first, stable while new rows are appended at the end."""
+
+    ordering = ("created", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200